@@ -1,6 +1,13 @@
 import os
-import requests
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from app.utils.lazy_import import lazy_module
+
+requests = lazy_module("requests")
 
 # Load environment variables from .env file
 load_dotenv()
@@ -9,27 +16,207 @@ load_dotenv()
 CLOUD_KEY = os.getenv("CLOUD_KEY")
 CLOUD_URL = os.getenv("AI_CLOUD_URL")
 
+# Bump when the upstream detector or the verdict mapping changes (invalidates cached verdicts)
+CLOUD_DETECTOR_VERSION = os.getenv("CLOUD_DETECTOR_VERSION", "1")
+CLOUD_ERROR_VERDICT = "Error detecting AI content."
 
-def cloud_init(data: str) -> dict:
-    
+# Client tuning
+CLOUD_CONNECT_TIMEOUT = float(os.getenv("CLOUD_CONNECT_TIMEOUT", "3"))
+CLOUD_READ_TIMEOUT = float(os.getenv("CLOUD_READ_TIMEOUT", "20"))
+CLOUD_MAX_RETRIES = int(os.getenv("CLOUD_MAX_RETRIES", "2"))
+CLOUD_BACKOFF_BASE = float(os.getenv("CLOUD_BACKOFF_BASE", "0.25"))
+CLOUD_BACKOFF_MAX = float(os.getenv("CLOUD_BACKOFF_MAX", "4"))
+CLOUD_BREAKER_THRESHOLD = int(os.getenv("CLOUD_BREAKER_THRESHOLD", "5"))
+CLOUD_BREAKER_COOLDOWN = float(os.getenv("CLOUD_BREAKER_COOLDOWN", "30"))
+CLOUD_MAX_CONCURRENCY = int(os.getenv("CLOUD_MAX_CONCURRENCY", "4"))
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def error_verdict() -> dict:
+    return {"ai_confidence": 0, "verdict": CLOUD_ERROR_VERDICT}
+
+
+def make_verdict(score: float) -> dict:
+    ai_confidence = round(score * 100, 2)  # convert to percentage
+    verdict = f"The given document is/has AI-generated content. The AI confidence is {ai_confidence}%."
+    return {"ai_confidence": ai_confidence, "verdict": verdict}
+
+
+def combine_verdicts(verdicts: list[dict], weights: list[int]) -> dict:
+    """
+    Merge per-segment verdicts into one, weighting confidence by segment size.
+    Failed segments are ignored; if every segment failed the error verdict is returned.
+    """
+    ok = [(v, w) for v, w in zip(verdicts, weights) if v.get("verdict") != CLOUD_ERROR_VERDICT]
+    if not ok:
+        return error_verdict()
+    if len(ok) == 1:
+        return ok[0][0]
+
+    total = sum(w or 1 for _, w in ok)
+    score = sum(v["ai_confidence"] * (w or 1) for v, w in ok) / total / 100
+    return make_verdict(score)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for `cooldown`
+    seconds. Then it is half-open: one caller is let through as a trial and the
+    rest are rejected until the trial records a success (closed) or a failure
+    (open for another cooldown). A trial that never reports back is replaced
+    after a further cooldown.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._half_open = False
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.cooldown:
+                return False
+            if self._half_open and now - self._trial_started < self.cooldown:
+                return False
+            self._half_open = True
+            self._trial_started = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._half_open = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._half_open or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._half_open = False
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+
+class CloudDetectorClient:
+    """
+    Client for the cloud AI detector: pooled keep-alive session, timeouts,
+    retry with jittered exponential backoff and a circuit breaker.
+    """
+
+    def __init__(self, url: str, key: str,
+                 connect_timeout: float = CLOUD_CONNECT_TIMEOUT,
+                 read_timeout: float = CLOUD_READ_TIMEOUT,
+                 max_retries: int = CLOUD_MAX_RETRIES,
+                 backoff_base: float = CLOUD_BACKOFF_BASE,
+                 backoff_max: float = CLOUD_BACKOFF_MAX,
+                 max_concurrency: int = CLOUD_MAX_CONCURRENCY,
+                 breaker: CircuitBreaker | None = None):
+        self.url = url
+        self.key = key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max(1, max_concurrency)
+        self.breaker = breaker or CircuitBreaker(CLOUD_BREAKER_THRESHOLD, CLOUD_BREAKER_COOLDOWN)
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt: int) -> None:
+        # Full jitter: uniform over [0, min(max, base * 2^attempt)]
+        time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt))))
+
+    def detect(self, text: str) -> dict:
+        """
+        Score one text segment. Never raises for upstream trouble; returns the
+        error verdict instead (immediately while the circuit is open).
+        """
+        if not self.breaker.allow():
+            return error_verdict()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, json={"key": self.key, "text": text}, timeout=self.timeout)
+            except requests.RequestException:
+                response = None
+
+            if response is not None and 200 <= response.status_code < 300:
+                self.breaker.record_success()
+                try:
+                    res = response.json()
+                except ValueError:
+                    return error_verdict()
+                return make_verdict(res.get("score", 0))  # Sapling score between 0-1
+
+            if response is not None and response.status_code not in _RETRY_STATUS:
+                # Client-side error: retrying will not help and upstream is healthy
+                self.breaker.record_success()
+                return error_verdict()
+
+            if attempt < self.max_retries:
+                self._backoff(attempt)
+
+        self.breaker.record_failure()
+        return error_verdict()
+
+    def detect_many(self, texts: list[str]) -> list[dict]:
+        """Score several segments concurrently; results keep input order."""
+        if len(texts) <= 1:
+            return [self.detect(t) for t in texts]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(texts))) as pool:
+            return list(pool.map(self.detect, texts))
+
+    async def adetect(self, text: str) -> dict:
+        """Async variant of detect; the pooled session runs in a worker thread."""
+        return await asyncio.to_thread(self.detect, text)
+
+    async def adetect_many(self, texts: list[str]) -> list[dict]:
+        """Async variant of detect_many, bounded by max_concurrency."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def one(text):
+            async with semaphore:
+                return await self.adetect(text)
+
+        return list(await asyncio.gather(*(one(t) for t in texts)))
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_cloud_client() -> CloudDetectorClient:
+    """Shared client built from CLOUD_KEY / AI_CLOUD_URL."""
+    global _client
     if not CLOUD_KEY or not CLOUD_URL:
         raise ValueError("CLOUD_KEY or CLOUD_URL is not set in environment variables.")
+    with _client_lock:
+        if _client is None:
+            _client = CloudDetectorClient(CLOUD_URL, CLOUD_KEY)
+        return _client
 
-    response = requests.post(
-        CLOUD_URL,
-        json={
-            "key": CLOUD_KEY,
-            "text": data
-        }
-    )
 
-    if 200 <= response.status_code < 300:
-        res = response.json()
-        score = res.get("score", 0)  # Sapling score between 0-1
-        ai_confidence = round(score * 100, 2)  # convert to percentage
-        verdict = f"The given document is/has AI-generated content. The AI confidence is {ai_confidence}%."
-        return {"ai_confidence": ai_confidence, "verdict": verdict}
+def cloud_init(data: str) -> dict:
+    return get_cloud_client().detect(data)
 
-    # On error, just return zero confidence and verdict
-    return {"ai_confidence": 0, "verdict": "Error detecting AI content."}
 
+def cloud_init_many(segments: list[str]) -> list[dict]:
+    return get_cloud_client().detect_many(segments)
@@ -1,7 +1,26 @@
+from __future__ import annotations
+
+import io
 import os
-import numpy as np
-from PIL import Image
-import exifread
+import math
+from app.utils.lazy_import import lazy_module
+
+np = lazy_module("numpy")
+Image = lazy_module("PIL.Image")
+exifread = lazy_module("exifread")
+
+# Pixel decoding: "full" analyzes images at their own resolution (up to
+# IMAGE_MAX_PIXELS), "sampled" decodes them at about IMAGE_SAMPLE_PIXELS, which
+# is much cheaper on large scans but measures a downscaled image.
+IMAGE_DECODE = os.getenv("IMAGE_DECODE", "full")
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))
+IMAGE_SAMPLE_PIXELS = int(os.getenv("IMAGE_SAMPLE_PIXELS", "4000000"))
+
+if IMAGE_DECODE not in ("full", "sampled"):
+    raise ValueError(f"IMAGE_DECODE must be 'full' or 'sampled', not {IMAGE_DECODE!r}")
+
+# Most pixels decoded for one analysis; bounds the per-image working set
+DECODE_PIXELS = IMAGE_MAX_PIXELS if IMAGE_DECODE == "full" else min(IMAGE_SAMPLE_PIXELS, IMAGE_MAX_PIXELS)
 
 # ------------------ Loaders ------------------
 
@@ -11,15 +30,51 @@ def load_image(path: str) -> Image.Image:
         raise FileNotFoundError(f"Image not found: {path}")
     return Image.open(path)
 
+def read_image_bytes(path: str) -> bytes:
+    """Read an image file once; EXIF and pixels are both parsed from these bytes."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Image not found: {path}")
+    with open(path, 'rb') as f:
+        return f.read()
+
+def exif_from_bytes(data: bytes) -> dict:
+    try:
+        tags = exifread.process_file(io.BytesIO(data), details=False)
+        return {tag: str(tags[tag]) for tag in tags}
+    except Exception:
+        return {}
+
 def get_exif_data(path: str) -> dict:
     """Extract EXIF metadata from an image file."""
     try:
-        with open(path, 'rb') as f:
-            tags = exifread.process_file(f, details=False)
-        return {tag: str(tags[tag]) for tag in tags}
+        return exif_from_bytes(read_image_bytes(path))
     except Exception:
         return {}
 
+def decode_image(data: bytes, max_pixels: int = DECODE_PIXELS) -> tuple[Image.Image, str | None]:
+    """
+    Decode image bytes to at most max_pixels pixels. Returns (image, format).
+    JPEGs are decoded directly at a reduced scale (DCT scaling through draft());
+    other formats are decoded in full and then sampled down by an integer factor.
+    """
+    image = Image.open(io.BytesIO(data))
+    image_format = image.format
+
+    pixels = image.width * image.height
+    if max_pixels and pixels > max_pixels:
+        scale = math.sqrt(pixels / max_pixels)
+        image.draft(image.mode, (math.ceil(image.width / scale), math.ceil(image.height / scale)))
+
+        # draft() only gets within a power of two (and is a no-op for non-JPEG)
+        pixels = image.width * image.height
+        if pixels > max_pixels:
+            factor = math.ceil(math.sqrt(pixels / max_pixels))
+            sampled = image.resize((max(1, image.width // factor), max(1, image.height // factor)), Image.Resampling.NEAREST)
+            image.close()
+            image = sampled
+
+    return image, image_format
+
 # ------------------ Checks ------------------
 
 def check_metadata(exif: dict, filename: str = "") -> tuple[int, list[str]]:
@@ -52,61 +107,178 @@ def check_metadata(exif: dict, filename: str = "") -> tuple[int, list[str]]:
 
     return score, reasons
 
-def check_entropy(image: Image.Image) -> float:
-    grayscale = image.convert('L')
-    pixels = np.array(grayscale).flatten()
-    histogram = np.histogram(pixels, bins=256)[0]
+def grayscale_array(image: Image.Image) -> np.ndarray:
+    """Convert once to an 8-bit grayscale array shared by the pixel checks."""
+    return np.asarray(image.convert('L'))
+
+HISTOGRAM_BAND_PIXELS = 1 << 20
+
+def entropy_from_gray(gray: np.ndarray) -> float:
+    # Histogram the 256 possible values instead of every pixel; binning over
+    # the image's own (min, max) range matches np.histogram(pixels, bins=256).
+    # bincount works on an intp copy, so count a band of rows at a time
+    counts = np.zeros(256, dtype=np.int64)
+    rows_per_band = max(1, HISTOGRAM_BAND_PIXELS // max(1, gray.shape[-1]))
+    for start in range(0, gray.shape[0], rows_per_band):
+        counts += np.bincount(gray[start:start + rows_per_band].ravel(), minlength=256)
+    present = np.flatnonzero(counts)
+    value_range = (int(present[0]), int(present[-1]))
+    histogram = np.histogram(np.arange(256), bins=256, range=value_range, weights=counts)[0]
     probs = histogram / np.sum(histogram)
-    entropy = -np.sum([p * np.log2(p) for p in probs if p > 0])
+    probs = probs[probs > 0]
+    entropy = -np.sum(probs * np.log2(probs))
     return float(entropy)
 
-def check_color_distribution(image: Image.Image) -> float:
-    pixels = np.array(image)
+def check_entropy(image: Image.Image) -> float:
+    return entropy_from_gray(grayscale_array(image))
+
+def color_std_from_pixels(pixels: np.ndarray) -> float:
     if len(pixels.shape) == 3:  # RGB
         r, g, b = pixels[:, :, 0], pixels[:, :, 1], pixels[:, :, 2]
         return float(np.mean([np.std(r), np.std(g), np.std(b)]))
     return 0.0
 
+def color_std_from_image(image: Image.Image) -> float:
+    """
+    color_std_from_pixels(np.array(image)) from PIL's per-band histograms, so
+    no full-size pixel array (or its float64 copies) is ever materialized.
+    """
+    if len(image.getbands()) < 3:
+        return 0.0
+    counts = np.array(image.histogram()[:3 * 256], dtype=np.float64).reshape(3, 256)
+    values = np.arange(256, dtype=np.float64)
+    total = counts.sum(axis=1)
+    means = counts @ values / total
+    variances = (counts * (values - means[:, None]) ** 2).sum(axis=1) / total
+    return float(np.mean(np.sqrt(variances)))
+
+def check_color_distribution(image: Image.Image) -> float:
+    return color_std_from_image(image)
+
+BLOCK_SIZE = 8
+BLOCK_ROWS_PER_BAND = 32  # bounds the float64 scratch buffer on large scans
+
+def blockiness_from_gray(gray: np.ndarray) -> float:
+    h, w = gray.shape
+    # Same grid as stepping range(0, h - 8, 8) over full 8x8 blocks
+    rows = len(range(0, h - BLOCK_SIZE, BLOCK_SIZE))
+    cols = len(range(0, w - BLOCK_SIZE, BLOCK_SIZE))
+    if not rows or not cols:
+        return 0.0
+
+    area = BLOCK_SIZE * BLOCK_SIZE
+    stds = np.empty((rows, cols))
+    for start in range(0, rows, BLOCK_ROWS_PER_BAND):
+        stop = min(rows, start + BLOCK_ROWS_PER_BAND)
+        band = gray[start * BLOCK_SIZE:stop * BLOCK_SIZE, :cols * BLOCK_SIZE]
+        # One contiguous row of 64 pixels per block, so each reduction below
+        # sums in the same order as np.std on a single block.
+        blocks = (band.reshape(stop - start, BLOCK_SIZE, cols, BLOCK_SIZE)
+                  .swapaxes(1, 2)
+                  .reshape(stop - start, cols, area))
+        means = blocks.sum(axis=2, dtype=np.float64) / area
+        dev = blocks - means[..., None]
+        dev *= dev
+        stds[start:stop] = np.sqrt(dev.sum(axis=2) / area)
+    return float(np.mean(stds.ravel()))
+
 def check_blockiness(image: Image.Image) -> float:
-    grayscale = image.convert('L')
-    pixels = np.array(grayscale)
-    h, w = pixels.shape
-    blocks = []
-    for i in range(0, h - 8, 8):
-        for j in range(0, w - 8, 8):
-            block = pixels[i:i + 8, j:j + 8]
-            blocks.append(np.std(block))
-    return float(np.mean(blocks)) if blocks else 0.0
+    return blockiness_from_gray(grayscale_array(image))
 
 # ------------------ Main Inspector ------------------
 
-def image_inspector(img_input) -> dict:
+# Bump when a check or threshold changes so cached results are recomputed.
+# Features depend on the decode mode and pixel budget, so those are part of it.
+IMAGE_DETECTOR_VERSION = f"2-{IMAGE_DECODE}{DECODE_PIXELS}"
+
+def image_features(path: str) -> dict:
     """
-    Run AI vs Human heuristic detection on an image.
-    img_input: str (path) or dict with {"path": "..."}
+    Content-only measurements of an image: EXIF plus pixel statistics.
+    Independent of the file name, so it can be cached by image hash.
+    Raises FileNotFoundError if the image does not exist.
     """
-    if isinstance(img_input, dict):
-        path = img_input.get("path", "")
-        name = os.path.basename(path)
-    else:
-        path = img_input
-        name = os.path.basename(path)
+    return features_from_bytes(read_image_bytes(path))
 
-    try:
-        image = load_image(path)
-    except FileNotFoundError:
-        return {"error": "Image not found", "file": path}
+def features_from_bytes(data: bytes) -> dict:
+    """
+    image_features() for an image already in memory. EXIF and pixels are parsed
+    from the same buffer, at most DECODE_PIXELS pixels are decoded, and only
+    the grayscale plane is ever held as an array.
+    """
+    exif = exif_from_bytes(data)
+    image, image_format = decode_image(data)
+    del data
+    with image:
+        bands = len(image.getbands())
+        color_std = color_std_from_image(image)
+        gray_image = image.convert('L')
+    # The decoded color image is released before the grayscale array is made
+    with gray_image:
+        gray = np.asarray(gray_image)
+    return {
+        "format": image_format,
+        "bands": bands,
+        "exif": exif,
+        "entropy": entropy_from_gray(gray),
+        "color_std": color_std,
+        "blockiness": blockiness_from_gray(gray)
+    }
+
+# Measured from the pixels; the rest of image_features() is per-file metadata
+PIXEL_FEATURES = ("entropy", "color_std", "blockiness")
+
+DHASH_SIZE = 8  # 8x8 gradient bits -> 64-bit hash
+
+def dhash_from_image(image: Image.Image) -> int:
+    """
+    64-bit difference hash: one bit per horizontally adjacent pixel pair of a
+    9x8 grayscale thumbnail, set where the left pixel is brighter. Re-encoding,
+    rescaling and small tone changes move it by only a few bits.
+    """
+    image.draft("L", (4 * (DHASH_SIZE + 1), 4 * DHASH_SIZE))
+    with image.convert("L") as gray:
+        thumbnail = gray.resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = pixels[:, :-1] > pixels[:, 1:]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def fingerprint_from_bytes(data: bytes) -> dict:
+    """
+    The cheap part of features_from_bytes(): format, band count and EXIF, plus
+    the dHash of a thumbnail-sized decode (JPEGs are DCT-scaled, so this is far
+    less work than the pixel checks). The dHash only sees luminance; "bands"
+    tells a grayscale copy of a color image apart.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image_format = image.format
+        bands = len(image.getbands())
+        image_hash = dhash_from_image(image)
+    return {"format": image_format, "bands": bands, "exif": exif_from_bytes(data), "dhash": image_hash}
+
+def warm_up() -> None:
+    """
+    Load NumPy, Pillow and exifread and run the checks once on a tiny in-memory
+    image, so a fresh process analyzes its first real image at full speed.
+    """
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").convert("RGB").save(buffer, "PNG")
+    features_from_bytes(buffer.getvalue())
+    fingerprint_from_bytes(buffer.getvalue())
 
-    exif = get_exif_data(path)
+def score_image(features: dict, name: str) -> dict:
+    """
+    Turn image_features() output into the inspector verdict for a given file name.
+    """
+    exif = features["exif"]
+    entropy = features["entropy"]
+    color_std = features["color_std"]
+    blockiness = features["blockiness"]
 
     flags = []
     metrics = {}
 
     # --- Run checks ---
     meta_score, meta_reasons = check_metadata(exif, name)
-    entropy = check_entropy(image)
-    color_std = check_color_distribution(image)
-    blockiness = check_blockiness(image)
 
     metrics.update({
         "entropy": round(entropy, 2),
@@ -130,7 +302,7 @@ def image_inspector(img_input) -> dict:
         score += weights["color_std"]
         flags.append("Low color variation (possible AI palette)")
 
-    if image.format != "PNG" and blockiness < 5:
+    if features["format"] != "PNG" and blockiness < 5:
         score += weights["blockiness"]
         flags.append("Low JPEG blockiness (may lack natural compression)")
 
@@ -140,3 +312,22 @@ def image_inspector(img_input) -> dict:
         "metrics": metrics,
         "exif": exif
     }
+
+def image_inspector(img_input) -> dict:
+    """
+    Run AI vs Human heuristic detection on an image.
+    img_input: str (path) or dict with {"path": "..."}
+    """
+    if isinstance(img_input, dict):
+        path = img_input.get("path", "")
+        name = os.path.basename(path)
+    else:
+        path = img_input
+        name = os.path.basename(path)
+
+    try:
+        features = image_features(path)
+    except FileNotFoundError:
+        return {"error": "Image not found", "file": path}
+
+    return score_image(features, name)
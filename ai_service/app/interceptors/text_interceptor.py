@@ -1,21 +1,66 @@
 # ================== advanced_text_interceptor.py ==================
 # Pure-Python heuristic detector tuned to catch GPT-4 / Gemini / Meta-like outputs
-# No external pip installs. Uses stylometric and structural heuristics + prototype matching.
+# Uses stylometric and structural heuristics + prototype matching.
+# analyze_text is pure Python; analyze_text_batch scores whole documents with NumPy.
 
 import re
 import math
+from functools import cache
 from collections import Counter, defaultdict
 
+from app.utils.lazy_import import lazy_module
+
+np = lazy_module("numpy")
+
+
+# Bump when a metric, weight or prototype changes so cached results are recomputed.
+TEXT_DETECTOR_VERSION = "1"
+
+
+# ------------------- Precompiled tables -------------------
+
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+_TOKEN_RE = re.compile(r"\w+|[.,;:()—%-]")
+_WORD_RE = re.compile(r"[A-Za-z']+")
+_ENUM_LINE_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_CONTRACTION_PATTERN = r"\b(?:I'm|don't|didn't|can't|won't|isn't|it's|that's|there's|we're|we'll|you're|you've|they're)\b"
+_CONTRACTION_RE = re.compile(_CONTRACTION_PATTERN, flags=re.I)
+_NUMBER_RE = re.compile(r"\b\d+\b")
+_DATE_RE = re.compile(r"\b(19|20)\d{2}\b")
+# The only non-ASCII characters whose lower() yields an ASCII word character
+# (U+0130 'İ', U+212A KELVIN SIGN); without them tokenizing the lowered text is exact.
+_LOWERS_TO_ASCII_RE = re.compile("[\u0130\u212a]")
+
+# Contractions and numbers never overlap (letters vs digits), so one scan
+# yields both; a 4-digit number starting with 19/20 is exactly a _DATE_RE hit.
+_SCAN_RE = re.compile(
+    rf"(?P<contraction>{_CONTRACTION_PATTERN})|(?P<number>\b\d+\b)", flags=re.I
+)
+
+_TRANSITIONS = ('moreover', 'furthermore', 'however', 'thus', 'therefore',
+                'additionally', 'in conclusion', 'on the other hand', 'nevertheless')
+_HEDGES = ('it is possible that', 'it could be argued', 'may suggest',
+           'might indicate', 'it seems that', 'appears to be', 'as far as we can tell')
+_SENSORY = ('feel', 'see', 'hear', 'taste', 'touch', 'smell', 'remember', 'experience')
+_PRONOUNS = (' i ', ' we ', ' my ', ' our ', ' me ', ' us ')  # crude check
+_PUNCTUATION = (';', ':', '—', '(', ')', '...')
+
+# Every literal counted against the lowered chunk, deduplicated once at import.
+_PHRASES = tuple(dict.fromkeys(_TRANSITIONS + _HEDGES + _SENSORY + _PRONOUNS + _PUNCTUATION))
+
+_FUNCTION_WORDS = frozenset(["the", "and", "but", "if", "or", "as", "because", "that", "which",
+                             "of", "at", "by", "for", "with", "about", "into", "to"])
+
 
 # ------------------- Utility helpers -------------------
 
 def normalize(text: str) -> str:
-    return re.sub(r"\s+", " ", text.strip())
+    return " ".join(text.split())
 
 
 def split_sentences(text: str):
     # naive sentence splitter
-    parts = re.split(r'(?<=[.!?])\s+', text)
+    parts = _SENTENCE_SPLIT_RE.split(text)
     return [p.strip() for p in parts if p.strip()]
 
 
@@ -23,59 +68,66 @@ def split_sentences(text: str):
 
 def tokens(text: str):
     # simple tokenization: words and punctuation
-    return re.findall(r"\w+|[.,;:()—%-]", text)
+    return _TOKEN_RE.findall(text)
 
 
 def words(text: str):
-    return [w for w in re.findall(r"[A-Za-z']+", text)]
+    return _WORD_RE.findall(text)
 
 
-def avg_sentence_length(sentences):
-    lens = [len(s.split()) for s in sentences]
+def _length_stats(lens):
+    """Return (mean, std, burstiness) of sentence lengths."""
     if not lens:
-        return 0.0
-    return sum(lens) / len(lens)
+        return 0.0, 0.0, 0.0
+    mean = sum(lens) / len(lens)
+    std = 0.0
+    if len(lens) >= 2:
+        var = sum((l - mean) ** 2 for l in lens) / len(lens)
+        std = math.sqrt(var)
+    if mean == 0:
+        return mean, std, 0.0
+    return mean, std, std ** 2 / mean
+
+
+def avg_sentence_length(sentences):
+    return _length_stats([len(s.split()) for s in sentences])[0]
 
 
 def sentence_length_std(sentences):
-    lens = [len(s.split()) for s in sentences]
-    if len(lens) < 2:
-        return 0.0
-    mean = sum(lens) / len(lens)
-    var = sum((l - mean) ** 2 for l in lens) / len(lens)
-    return math.sqrt(var)
+    return _length_stats([len(s.split()) for s in sentences])[1]
 
 
 def burstiness(sentences):
-    mean = avg_sentence_length(sentences)
-    if mean == 0:
-        return 0.0
-    var = sentence_length_std(sentences) ** 2
-    return var / mean
+    return _length_stats([len(s.split()) for s in sentences])[2]
 
 
 def type_token_ratio(ws):
     return len(set(ws)) / max(1, len(ws))
 
 
+def _hapax_ratio(freq, n):
+    hapax = sum(1 for c in freq.values() if c == 1)
+    return hapax / max(1, n)
+
+
 def hapax_legomena_ratio(ws):
-    freq = Counter(ws)
-    hapax = sum(1 for _, c in freq.items() if c == 1)
-    return hapax / max(1, len(ws))
+    return _hapax_ratio(Counter(ws), len(ws))
 
 
-def zipf_deviation(ws):
-    freq = Counter(ws)
+def _zipf_deviation(freq, n):
     if not freq:
         return 0.0
     freqs = sorted(freq.values(), reverse=True)
     expected = [freqs[0] / (i + 1) for i in range(len(freqs))]
     deviation = sum(abs(a - e) for a, e in zip(freqs, expected)) / len(expected)
-    return deviation / max(1, len(ws))
+    return deviation / max(1, n)
 
 
-def entropy_score(ws):
-    freq = Counter(ws)
+def zipf_deviation(ws):
+    return _zipf_deviation(Counter(ws), len(ws))
+
+
+def _entropy(freq):
     total = sum(freq.values())
     if total == 0:
         return 0.0
@@ -83,53 +135,46 @@ def entropy_score(ws):
     return -sum(p * math.log2(p) for p in probs)
 
 
+def entropy_score(ws):
+    return _entropy(Counter(ws))
+
+
 def repetition_score(ws, n=3):
     if len(ws) < n:
         return 0.0
-    ngrams = [' '.join(ws[i:i + n]) for i in range(len(ws) - n + 1)]
-    freq = Counter(ngrams)
-    most = freq.most_common(1)
-    if not most:
-        return 0.0
-    return most[0][1] / len(ngrams)
+    # words never contain spaces, so tuple n-grams count like joined strings
+    freq = Counter(zip(*(ws[i:] for i in range(n))))
+    return max(freq.values()) / (len(ws) - n + 1)
 
 
 # ------------------- Structural & stylistic checks -------------------
 
 def contraction_ratio(text: str):
-    cont = re.findall(
-        r"\b(?:I'm|don't|didn't|can't|won't|isn't|it's|that's|there's|we're|we'll|you're|you've|they're)\b",
-        text, flags=re.I
-    )
-    ws = len(re.findall(r"[A-Za-z']+", text))
+    cont = _CONTRACTION_RE.findall(text)
+    ws = len(_WORD_RE.findall(text))
     return len(cont) / max(1, ws)
 
 
 def enumerated_list_density(text: str):
     lines = text.splitlines()
-    hits = 0
-    for l in lines:
-        if re.match(r"^\s*(?:[-*•]|\d+[.)])\s+", l):
-            hits += 1
+    hits = sum(1 for l in lines if _ENUM_LINE_RE.match(l))
     return hits / max(1, len(lines))
 
 
 def transition_density(text: str, sentences):
-    transitions = ['moreover', 'furthermore', 'however', 'thus', 'therefore',
-                   'additionally', 'in conclusion', 'on the other hand', 'nevertheless']
-    hits = sum(text.lower().count(t) for t in transitions)
+    lowered = text.lower()
+    hits = sum(lowered.count(t) for t in _TRANSITIONS)
     return hits / max(1, len(sentences))
 
 
 def hedging_phrases(text: str):
-    hedges = ['it is possible that', 'it could be argued', 'may suggest',
-              'might indicate', 'it seems that', 'appears to be', 'as far as we can tell']
-    return sum(text.lower().count(h) for h in hedges)
+    lowered = text.lower()
+    return sum(lowered.count(h) for h in _HEDGES)
 
 
 def numeric_density(text: str):
-    nums = re.findall(r"\b\d+\b", text)
-    ws = len(re.findall(r"[A-Za-z']+", text))
+    nums = _NUMBER_RE.findall(text)
+    ws = len(_WORD_RE.findall(text))
     return len(nums) / max(1, ws)
 
 
@@ -138,23 +183,79 @@ def parenthetical_density(text: str):
 
 
 def punctuation_diversity(text: str):
-    puncts = [';', ':', '—', '(', ')', '...']
-    return sum(text.count(p) for p in puncts)
+    return sum(text.count(p) for p in _PUNCTUATION)
 
 
 def sensory_language(text: str):
-    sensory = ['feel', 'see', 'hear', 'taste', 'touch', 'smell', 'remember', 'experience']
-    return sum(text.lower().count(s) for s in sensory)
+    lowered = text.lower()
+    return sum(lowered.count(s) for s in _SENSORY)
 
 
 def real_world_anchors(text: str):
-    date_patterns = r"\b(19|20)\d{2}\b"
-    pronouns = [' i ', ' we ', ' my ', ' our ', ' me ', ' us ']  # crude check
-    hits = sum(text.lower().count(p) for p in pronouns)
-    dates = len(re.findall(date_patterns, text))
+    lowered = text.lower()
+    hits = sum(lowered.count(p) for p in _PRONOUNS)
+    dates = len(_DATE_RE.findall(text))
     return hits + dates
 
 
+# ------------------- Single-pass feature engine -------------------
+
+def extract_features(text: str) -> dict:
+    """
+    Compute every stylometric metric of a chunk in one walk over it.
+    The text is normalized and lowered once, words are tokenized once and
+    counted into a single frequency table, contractions/numbers/dates come
+    from one regex scan and all phrase lists are counted against the same
+    lowered buffer. Values are identical to the individual helpers above.
+    """
+    t = normalize(text)
+    lowered = t.lower()
+    sents = split_sentences(t)
+    # sentences come from normalized text, so words are single-space separated
+    avg_len, std_len, burst = _length_stats([s.count(' ') + 1 for s in sents])
+
+    if not _LOWERS_TO_ASCII_RE.search(t):
+        ws = _WORD_RE.findall(lowered)
+    else:
+        ws = [w.lower() for w in _WORD_RE.findall(t)]
+    n = len(ws)
+    freq = Counter(ws)
+
+    contractions = numbers = dates = 0
+    for m in _SCAN_RE.finditer(t):
+        if m.lastgroup == 'contraction':
+            contractions += 1
+        else:
+            numbers += 1
+            num = m.group()
+            if len(num) == 4 and num[:2] in ('19', '20'):
+                dates += 1
+
+    phrase_hits = {p: lowered.count(p) for p in _PHRASES}
+    lines = t.splitlines()
+
+    metrics = {}
+    metrics['avg_sent_len'] = avg_len
+    metrics['sentence_std'] = std_len
+    metrics['burstiness'] = burst
+    metrics['type_token_ratio'] = len(freq) / max(1, n)
+    metrics['hapax_ratio'] = _hapax_ratio(freq, n)
+    metrics['zipf_dev'] = _zipf_deviation(freq, n)
+    metrics['entropy'] = _entropy(freq)
+    metrics['repetition'] = repetition_score(ws)
+    metrics['contraction'] = contractions / max(1, n)
+    metrics['enumerated_density'] = sum(1 for l in lines if _ENUM_LINE_RE.match(l)) / max(1, len(lines))
+    metrics['transition_density'] = sum(phrase_hits[p] for p in _TRANSITIONS) / max(1, len(sents))
+    metrics['hedging'] = sum(phrase_hits[p] for p in _HEDGES)
+    metrics['numeric_density'] = numbers / max(1, n)
+    metrics['punctuation_diversity'] = sum(phrase_hits[p] for p in _PUNCTUATION)
+    metrics['parenthetical'] = phrase_hits['('] + phrase_hits[')']
+    metrics['sensory'] = sum(phrase_hits[p] for p in _SENSORY)
+    metrics['real_world_anchors'] = sum(phrase_hits[p] for p in _PRONOUNS) + dates
+    metrics['function_word_ratio'] = sum(freq[w] for w in _FUNCTION_WORDS) / max(1, n)
+    return metrics
+
+
 # ------------------- Prototype signatures (heuristic) -------------------
 
 _PROTOTYPES = {
@@ -181,6 +282,26 @@ _PROTOTYPES = {
     }
 }
 
+# Metrics compared against each prototype, in scoring order.
+_SIMILARITY_KEYS = ('avg_sent_len', 'sentence_std', 'burstiness', 'zipf_dev', 'entropy',
+                    'repetition', 'contraction', 'function_word_ratio', 'transition_density',
+                    'enumerated_density', 'numeric_density', 'sensory')
+
+@cache
+def _prototype_matrix():
+    # Built on first use (or by warm_up), once per process
+    return np.array(
+        [[proto[k] for k in _SIMILARITY_KEYS] for proto in _PROTOTYPES.values()], dtype=float
+    )
+
+_AI_WEIGHTS = {
+    'zipf_dev': 0.12, 'repetition': 0.12, 'entropy': 0.12,
+    'burstiness': 0.12, 'hapax_ratio': 0.08, 'contraction': 0.08,
+    'function_word_ratio': 0.08, 'transition_density': 0.06,
+    'enumerated_density': 0.06, 'numeric_density': 0.06
+}
+_AI_WEIGHT_TOTAL = sum(_AI_WEIGHTS.values())
+
 
 # ------------------- Scoring utilities -------------------
 
@@ -195,41 +316,10 @@ def scalar_similarity(x, proto, weight=1.0):
 # ------------------- Main detector -------------------
 
 def analyze_text(text: str):
-    t = normalize(text)
-    sents = split_sentences(t)
-    ws = [w.lower() for w in words(t)]
-
-    metrics = {}
-    metrics['avg_sent_len'] = avg_sentence_length(sents)
-    metrics['sentence_std'] = sentence_length_std(sents)
-    metrics['burstiness'] = burstiness(sents)
-    metrics['type_token_ratio'] = type_token_ratio(ws)
-    metrics['hapax_ratio'] = hapax_legomena_ratio(ws)
-    metrics['zipf_dev'] = zipf_deviation(ws)
-    metrics['entropy'] = entropy_score(ws)
-    metrics['repetition'] = repetition_score(ws)
-    metrics['contraction'] = contraction_ratio(t)
-    metrics['enumerated_density'] = enumerated_list_density(t)
-    metrics['transition_density'] = transition_density(t, sents)
-    metrics['hedging'] = hedging_phrases(t)
-    metrics['numeric_density'] = numeric_density(t)
-    metrics['punctuation_diversity'] = punctuation_diversity(t)
-    metrics['parenthetical'] = parenthetical_density(t)
-    metrics['sensory'] = sensory_language(t)
-    metrics['real_world_anchors'] = real_world_anchors(t)
-
-    func_words = set(["the", "and", "but", "if", "or", "as", "because", "that", "which",
-                      "of", "at", "by", "for", "with", "about", "into", "to"])
-    metrics['function_word_ratio'] = sum(1 for w in ws if w in func_words) / max(1, len(ws))
+    metrics = extract_features(text)
 
     # AI-likeness scoring
     ai_like_score = 0.0
-    ai_weights = {
-        'zipf_dev': 0.12, 'repetition': 0.12, 'entropy': 0.12,
-        'burstiness': 0.12, 'hapax_ratio': 0.08, 'contraction': 0.08,
-        'function_word_ratio': 0.08, 'transition_density': 0.06,
-        'enumerated_density': 0.06, 'numeric_density': 0.06
-    }
 
     sub = {}
     sub['zipf_dev'] = min(1.0, metrics['zipf_dev'] / 0.05)
@@ -245,27 +335,15 @@ def analyze_text(text: str):
     sub['enumerated_density'] = min(1.0, metrics['enumerated_density'] / 0.2)
     sub['numeric_density'] = min(1.0, metrics['numeric_density'] / 0.1)
 
-    for k, w in ai_weights.items():
+    for k, w in _AI_WEIGHTS.items():
         ai_like_score += sub.get(k, 0.0) * w
 
-    ai_like_score = ai_like_score / sum(ai_weights.values())
+    ai_like_score = ai_like_score / _AI_WEIGHT_TOTAL
 
     # Model-specific similarity
     model_scores = {}
     for model, proto in _PROTOTYPES.items():
-        sims = []
-        sims.append(scalar_similarity(metrics['avg_sent_len'], proto['avg_sent_len']))
-        sims.append(scalar_similarity(metrics['sentence_std'], proto['sentence_std']))
-        sims.append(scalar_similarity(metrics['burstiness'], proto['burstiness']))
-        sims.append(scalar_similarity(metrics['zipf_dev'], proto['zipf_dev']))
-        sims.append(scalar_similarity(metrics['entropy'], proto['entropy']))
-        sims.append(scalar_similarity(metrics['repetition'], proto['repetition']))
-        sims.append(scalar_similarity(metrics['contraction'], proto['contraction']))
-        sims.append(scalar_similarity(metrics['function_word_ratio'], proto['function_word_ratio']))
-        sims.append(scalar_similarity(metrics['transition_density'], proto['transition_density']))
-        sims.append(scalar_similarity(metrics['enumerated_density'], proto['enumerated_density']))
-        sims.append(scalar_similarity(metrics['numeric_density'], proto['numeric_density']))
-        sims.append(scalar_similarity(metrics['sensory'], proto['sensory']))
+        sims = [scalar_similarity(metrics[k], proto[k]) for k in _SIMILARITY_KEYS]
         model_scores[model] = sum(sims) / len(sims)
 
     raw = {m: model_scores[m] * ai_like_score for m in model_scores}
@@ -289,3 +367,78 @@ def analyze_text(text: str):
     return result
 
 
+def analyze_text_batch(texts):
+    """
+    Score every chunk of a document at once.
+    Features are extracted per chunk, then subscores, the AI-weight blend and
+    prototype similarity are computed as array operations over an N x F matrix.
+    Returns the same dicts as analyze_text, in input order.
+    """
+    if not texts:
+        return []
+
+    all_metrics = [extract_features(t) for t in texts]
+    keys = list(all_metrics[0])
+    X = np.array([[m[k] for k in keys] for m in all_metrics], dtype=float)
+    col = {k: X[:, i] for i, k in enumerate(keys)}
+
+    sub = {}
+    sub['zipf_dev'] = np.minimum(1.0, col['zipf_dev'] / 0.05)
+    sub['repetition'] = np.minimum(1.0, col['repetition'] / 0.12)
+    sub['entropy'] = 1.0 - np.minimum(1.0, col['entropy'] / 5.0)
+    sub['burstiness'] = 1.0 - np.minimum(1.0, col['burstiness'] / 3.0)
+    sub['hapax_ratio'] = 1.0 - np.minimum(1.0, col['hapax_ratio'] / 0.15)
+    sub['contraction'] = 1.0 - np.minimum(1.0, col['contraction'] / 0.05)
+    sub['function_word_ratio'] = np.maximum(0.0, 1.0 - np.abs(col['function_word_ratio'] - 0.38) / 0.3)
+    sub['transition_density'] = np.minimum(1.0, col['transition_density'] / 0.3)
+    sub['enumerated_density'] = np.minimum(1.0, col['enumerated_density'] / 0.2)
+    sub['numeric_density'] = np.minimum(1.0, col['numeric_density'] / 0.1)
+
+    # Accumulate column by column so float sums match the per-chunk path exactly.
+    ai_like = np.zeros(len(texts))
+    for k, w in _AI_WEIGHTS.items():
+        ai_like += sub[k] * w
+    ai_like = ai_like / _AI_WEIGHT_TOTAL
+
+    # N x models x features similarity tensor, same formula as scalar_similarity
+    V = np.stack([col[k] for k in _SIMILARITY_KEYS], axis=1)[:, None, :]
+    P = _prototype_matrix()[None, :, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        decay = np.exp(-3.0 * (np.abs(V - P) / (np.abs(P) + 1e-9)))
+    sims = np.where(P == 0, (V == 0).astype(float), decay)
+
+    model_scores = np.zeros(sims.shape[:2])
+    for j in range(sims.shape[2]):
+        model_scores += sims[:, :, j]
+    model_scores = model_scores / sims.shape[2]
+
+    raw = model_scores * ai_like[:, None]
+    total = np.zeros(len(texts))
+    for j in range(raw.shape[1]):
+        total += raw[:, j]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = raw / total[:, None]
+
+    models = list(_PROTOTYPES)
+    sub_rows = {k: v.tolist() for k, v in sub.items()}
+    results = []
+    for i, metrics in enumerate(all_metrics):
+        if total[i] <= 0:
+            normalized = {m: 0.0 for m in models}
+        else:
+            normalized = {m: round(v, 3) for m, v in zip(models, shares[i].tolist())}
+        results.append({
+            'ai_like_score': round(float(ai_like[i]), 3),
+            'model_likelihoods': normalized,
+            'metrics': metrics,
+            'subscores': {k: v[i] for k, v in sub_rows.items()}
+        })
+    return results
+
+
+def warm_up():
+    """
+    Load NumPy, build the prototype table and score one tiny batch, so a fresh
+    process (server worker or pool child) handles its first document at full speed.
+    """
+    analyze_text_batch(["However, this is a short warm-up text. It was written in 2024; we don't need more."])
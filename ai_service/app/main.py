@@ -1,10 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routes import analyze_routes, document_routes, image_routes, json_routes
+from starlette.concurrency import run_in_threadpool
+from app import startup
+from app.routes import analyze_routes, document_routes, image_routes, json_routes, metrics_routes
 
-app = FastAPI(title="AI Service Backend")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Each worker warms up before it accepts requests (APP_WARM_UP=1)
+    if startup.WARM_UP:
+        await run_in_threadpool(startup.warm_up)
+    yield
+
+
+app = FastAPI(title="AI Service Backend", lifespan=lifespan)
 
 # Register routes
 app.include_router(document_routes.router)
 app.include_router(json_routes.router)
 app.include_router(image_routes.router)
 app.include_router(analyze_routes.router)
+app.include_router(metrics_routes.router)
@@ -1,104 +1,766 @@
 import os
+import math
+import time
+import random
+import hashlib
+import contextvars
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 import orjson
 from fastapi import APIRouter, Query, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 from app.api.ApiResponse import ApiResponse
-from app.helpers.cloud_helper import cloud_init 
-from app.services.chunk_service import chunk_text_from_json
-from app.interceptors.text_interceptor import analyze_text
-from app.interceptors.Image_interceptor import image_inspector
+from app.helpers.cloud_helper import CLOUD_DETECTOR_VERSION, CLOUD_ERROR_VERDICT, cloud_init_many, combine_verdicts
+from app.services.analysis_service import analyze_concurrently
+from app.services.cache_service import cache_get, cache_get_many, cache_key, cache_put, cache_put_many, content_digest
+from app.services.chunk_service import CHUNKER_VERSION, chunk_text_from_json, image_id, iter_chunks, iter_pages
+from app.services.document_service import SUPPORTED_EXTENSIONS, extract_document_bytes
+from app.services.image_service import public_image_record
+from app.services.minhash_service import (CHUNK_SIMILARITY, DOCUMENT_SIMILARITY, MINHASH_REUSE, add_signatures,
+                                          find_similar, get_signature, minhash, remove_signatures)
+from app.services.phash_service import PHASH_REUSE, add_image_hashes, find_near_images
+from app.utils.file_utils import UploadTooLarge, read_multipart_upload
+from app.utils.json_utils import find_output_file
+from app.utils.output_index import document_base
+from app.utils.metrics import increment, observe, profile_call, timed
+from app.interceptors.text_interceptor import TEXT_DETECTOR_VERSION
+from app.interceptors.Image_interceptor import IMAGE_DETECTOR_VERSION, PIXEL_FEATURES, score_image
 
 OUTPUT_DIR = "output"
 IMAGES_DIR = "images"
 
+# Chunks scored together per step of /analyze/stream: small enough for a fast
+# first result, large enough to keep the text and image pools busy
+STREAM_BATCH = int(os.getenv("ANALYZE_STREAM_BATCH", "8"))
+
+# Largest upload POST /analyze/upload holds in memory
+MEMORY_UPLOAD_MAX_BYTES = int(os.getenv("MEMORY_UPLOAD_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Adaptive mode: chunks scored per step, the fewest scored before stopping,
+# and the normal quantile of the interval on the mean ai_like_score (95%)
+ADAPTIVE_BATCH = int(os.getenv("ANALYZE_ADAPTIVE_BATCH", "16"))
+ADAPTIVE_MIN_CHUNKS = int(os.getenv("ANALYZE_ADAPTIVE_MIN_CHUNKS", "16"))
+ADAPTIVE_CONFIDENCE = 0.95
+ADAPTIVE_Z = 1.96
+
+# Bumped when the shape of the /analyze response changes
+RESPONSE_VERSION = "3"
+
+# A whole-document result depends on every detector involved
+DOCUMENT_VERSION = f"{TEXT_DETECTOR_VERSION}.{IMAGE_DETECTOR_VERSION}.{CLOUD_DETECTOR_VERSION}.r{RESPONSE_VERSION}.c{CHUNKER_VERSION}"
+
 router = APIRouter(prefix="/analyze", tags=["analysis"])
 
 
-@router.get("/")
-def analyze_file(request: Request, filename: str = Query(..., description="Base filename (with or without .json)")):
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cached_features(keys: dict, refresh: bool) -> dict:
+    """{item: cached value} for {item: cache key}."""
+    if refresh or not keys:
+        return {}
+    cached = cache_get_many(keys.values())
+    return {item: cached[key] for item, key in keys.items() if key in cached}
+
+
+def _near_duplicate_features(image_hash: int, image_format: str | None, bands: int) -> dict | None:
     """
-    Analyze chunks of text and images from a processed JSON file.
-    Automatically chunks JSON if 'chunks' key is missing.
-    Returns actual chunk text along with text and image analysis results.
+    Pixel statistics of the nearest analyzed image of the same format and band
+    count within PHASH_MAX_DISTANCE bits of image_hash, or None. Only images
+    whose features are still cached can be reused.
     """
-    # Normalize filename
-    if not filename.lower().endswith(".json"):
-        filename = f"{filename}.json"
-    file_path = os.path.join(OUTPUT_DIR, filename)
+    for _, digest in find_near_images(image_hash):
+        features = cache_get(cache_key("image", IMAGE_DETECTOR_VERSION, digest))
+        # Blockiness means something else for a PNG than for a JPEG, and the
+        # luminance-only dHash matches a grayscale copy, whose color_std is 0
+        if features is not None and features.get("format") == image_format and features.get("bands") == bands:
+            increment("images_near_duplicate")
+            reused = {name: features[name] for name in PIXEL_FEATURES}
+            reused["near_duplicate_of"] = digest
+            return reused
+    return None
+
+
+def _near_duplicate_texts(signatures: dict) -> dict:
+    """
+    {text: result} for the texts of {text: minhash} that are at least
+    CHUNK_SIMILARITY similar to a chunk scored before, taken from its cached
+    result. Index entries whose result has left the cache are dropped.
+    """
+    reused = {}
+    for text, signature in signatures.items():
+        for similarity, digest in find_similar("chunk", signature, CHUNK_SIMILARITY):
+            result = cache_get(cache_key("text", TEXT_DETECTOR_VERSION, digest))
+            if result is None:
+                remove_signatures("chunk", [digest])
+                continue
+            increment("chunks_near_duplicate")
+            reused[text] = {**result, "near_duplicate_of": digest, "similarity": round(similarity, 3)}
+            break
+    return reused
+
+
+def _document_scope(name: str, userId: str | None, username: str | None) -> tuple[str, str | None]:
+    """
+    (key, owner kind) for the near-duplicate check of a document. The key is
+    its base name, the same for the upload and its page pack. The owner kind is
+    None unless the caller names the owner the file was saved for
+    (<file>_<username>_<userId>): documents are only compared with the same
+    owner's, so one user's file names are never shown to another.
+    """
+    key = document_base(name)
+    if userId and username and key.endswith(f"_{username}_{userId}"):
+        return key, f"document:{username}_{userId}"
+    return key, None
+
+
+def _near_duplicate_documents(scope: tuple[str, str | None], signature=None, cached: bool = False) -> list[dict]:
+    """
+    The owner's other documents at least DOCUMENT_SIMILARITY similar to this
+    one, most similar first. A fresh analysis (re)indexes the document under
+    signature; a cached one is compared by the signature indexed when it was
+    analyzed. Computed for every response and never cached, so documents added
+    later are seen.
+    """
+    if not MINHASH_REUSE:
+        return []
+    key, kind = scope
+    if cached:
+        if kind is None:
+            return []
+        signature = get_signature(kind, key)
+        if signature is None:
+            # Analyzed before this owner asked: take its signature from the "document" index
+            signature = get_signature("document", key)
+            add_signatures(kind, {key: signature})
+    else:
+        # Every document's signature is kept, so a cached response can be compared later
+        for index in ("document", kind) if kind else ("document",):
+            if signature is None:
+                remove_signatures(index, [key])
+            else:
+                add_signatures(index, {key: signature})
+    if kind is None or signature is None:
+        return []
+
+    matches = [{"filename": other, "similarity": round(similarity, 3)}
+               for similarity, other in find_similar(kind, signature, DOCUMENT_SIMILARITY) if other != key]
+    if matches:
+        increment("documents_near_duplicate")
+    return matches
+
+
+def _image_path(img_info) -> str | None:
+    # Handle dict or str
+    if isinstance(img_info, dict):
+        return img_info.get("path")
+    if isinstance(img_info, str):
+        return os.path.join(IMAGES_DIR, img_info)
+    return None
+
+
+def _image_source(img_info):
+    # Bytes of an in-memory record, else the image path if the file exists
+    if isinstance(img_info, dict) and "data" in img_info:
+        return img_info["data"]
+    img_path = _image_path(img_info)
+    if img_path and os.path.exists(img_path):
+        return img_path
+    return None
+
+
+def _image_name(img_info) -> str:
+    # File name the per-image heuristics look at
+    img_path = _image_path(img_info)
+    if img_path:
+        return os.path.basename(img_path)
+    return f"{img_info['id']}.{img_info.get('ext', 'png')}"
+
+
+def _image_table(data: dict) -> tuple[dict, list[list[str]]]:
+    """
+    Document-level image table {id: record} plus each chunk's image ids.
+    Chunks may hold ids into data["images"] or, in older files, full records.
+    """
+    table = {image_id(img): img for img in data.get("images", [])}
+    chunk_ids = []
+    for chunk in data["chunks"]:
+        ids = []
+        for img_info in chunk.get("images", []):
+            img_id = image_id(img_info)
+            table.setdefault(img_id, img_info)
+            ids.append(img_id)
+        chunk_ids.append(ids)
+    return table, chunk_ids
 
-    if not os.path.exists(file_path):
+
+def _cloud_verdict(segments: list[str], refresh: bool) -> dict:
+    """
+    Cloud verdict over the given text segments; uncached segments are sent concurrently.
+    """
+    keys = [cache_key("cloud", CLOUD_DETECTOR_VERSION, content_digest(s)) for s in segments]
+    cached = {} if refresh else cache_get_many(keys)
+    verdicts = [cached.get(k) for k in keys]
+
+    missing = [i for i, v in enumerate(verdicts) if v is None]
+    if missing:
+        with timed("cloud"):
+            fresh = cloud_init_many([segments[i] for i in missing])
+        for i, verdict in zip(missing, fresh):
+            verdicts[i] = verdict
+            if verdict.get("verdict") != CLOUD_ERROR_VERDICT:
+                cache_put(keys[i], verdict)
+
+    return combine_verdicts(verdicts, [len(s) for s in segments])
+
+
+def _open_document(filename: str, refresh: bool, cloud_segments: int, max_words: int, overlap: int, span_pages: bool,
+                   sampling: str = ""):
+    """
+    Resolve and read an extraction output for analysis.
+    Returns (filename, file_path, data, document_key, cached): data is the parsed
+    JSON ({} for packs and NDJSON, which are chunked straight from disk) and
+    cached the whole-document cache entry, if any. `sampling` tells cached
+    results of other analysis modes apart.
+    """
+    # Normalize filename: page pack, JSON or streamed NDJSON output
+    resolved = find_output_file(filename)
+    if resolved is None:
         raise HTTPException(status_code=404, detail=f"File '{filename}' not found in {OUTPUT_DIR}/")
+    filename = resolved
+    file_path = os.path.join(OUTPUT_DIR, filename)
 
-    # Load JSON file
+    # Load JSON file (pack and NDJSON page records are chunked straight from disk below)
+    data = {}
     try:
-        with open(file_path, "rb") as f:
-            data = orjson.loads(f.read())
+        if filename.lower().endswith((".pack", ".ndjson")):
+            document_digest = _file_digest(file_path)
+        else:
+            with open(file_path, "rb") as f:
+                raw = f.read()
+            document_digest = content_digest(raw)
+            data = orjson.loads(raw)
+            del raw
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading {filename}: {str(e)}")
 
+    if overlap >= max_words:
+        raise HTTPException(status_code=400, detail="overlap must be smaller than max_words")
+
+    # Whole-document cache hit skips the pipeline entirely
+    chunking = f"w{max_words}.o{overlap}.p{int(span_pages)}"
+    document_key = cache_key("document", f"{DOCUMENT_VERSION}.s{cloud_segments}.{chunking}{sampling}", document_digest)
+    cached = None if refresh else cache_get(document_key)
+    if cached is not None:
+        cached["filename"] = filename
+
+    return filename, file_path, data, document_key, cached
+
+
+def _analyze_batch(chunk_texts: list[str], image_table: dict, refresh: bool) -> tuple[dict, dict, bool]:
+    """
+    Analyze the distinct texts and the images ({id: record}) of a set of chunks,
+    scoring only cache misses. Returns ({text: analysis}, {image id: analysis},
+    failed); failed results are reported inline and never cached.
+    """
+    # Distinct texts and images, minus what is already cached
+    texts = list(dict.fromkeys(t for t in chunk_texts if t.strip()))
+    text_digests = {t: content_digest(t) for t in texts}
+    text_keys = {t: cache_key("text", TEXT_DETECTOR_VERSION, d) for t, d in text_digests.items()}
+    text_results = _cached_features(text_keys, refresh)
+
+    # Images from the content-addressed store carry their SHA-256, so identical
+    # images under different ids (repeated logos, headers) share one inspection.
+    image_sources = {}
+    image_hashes = {}
+    for img_id, img_info in image_table.items():
+        source = _image_source(img_info)
+        if source is not None:
+            img_hash = img_info.get("hash") if isinstance(img_info, dict) else None
+            image_hashes[img_id] = img_hash or _file_digest(source)
+            image_sources.setdefault(image_hashes[img_id], source)
+    image_keys = {h: cache_key("image", IMAGE_DETECTOR_VERSION, h) for h in image_sources}
+    image_features = _cached_features(image_keys, refresh)
+
+    # Near-duplicates of chunks scored before (edited drafts, shared boilerplate) reuse their results
+    missing_texts = [t for t in texts if t not in text_results]
+    signatures = {t: minhash([t]) for t in missing_texts} if MINHASH_REUSE else {}
+    if signatures and not refresh:
+        reused = _near_duplicate_texts(signatures)
+        text_results.update(reused)
+        cache_put_many({text_keys[t]: r for t, r in reused.items()})
+        missing_texts = [t for t in missing_texts if t not in reused]
+
+    # Text scoring and image inspection run concurrently on their own pools
+    missing_images = {h: s for h, s in image_sources.items() if h not in image_features}
+    # Images that miss the cache may still be re-encodings of one analyzed before
+    near_lookup = _near_duplicate_features if PHASH_REUSE and not refresh else None
+    scored_texts, inspected = analyze_concurrently(missing_texts, missing_images, near_lookup)
+
+    text_results.update(zip(missing_texts, scored_texts))
+    image_features.update(inspected)
+    cache_put_many({text_keys[t]: r for t, r in zip(missing_texts, scored_texts) if isinstance(r, dict)})
+    cache_put_many({image_keys[h]: f for h, f in inspected.items() if isinstance(f, dict)})
+    add_signatures("chunk", {text_digests[t]: signatures.get(t) for t, r in zip(missing_texts, scored_texts) if isinstance(r, dict)})
+    # Only images measured from their own pixels become reuse targets
+    add_image_hashes({h: f["dhash"] for h, f in inspected.items()
+                      if isinstance(f, dict) and "dhash" in f and "near_duplicate_of" not in f})
+
+    # Errors and timeouts are transient; callers must not pin them in the document cache
+    failed = any(isinstance(r, Exception) for r in text_results.values()) or \
+        any(isinstance(f, Exception) for f in image_features.values())
+
+    for text, result in text_results.items():
+        if isinstance(result, Exception):
+            text_results[text] = {"error": f"Failed to analyze text: {str(result)}"}
+
+    images = {}
+    for img_id, img_info in image_table.items():
+        if img_id in image_hashes:
+            features = image_features[image_hashes[img_id]]
+            if isinstance(features, Exception):
+                images[img_id] = {"error": f"Failed to analyze image: {str(features)}", "file": public_image_record(img_info)}
+            else:
+                # File-name heuristics are applied per image, on top of the shared features
+                images[img_id] = score_image(features, _image_name(img_info))
+        else:
+            images[img_id] = {"error": "Image not found", "file": img_info}
+
+    return text_results, images, failed
+
+
+def _chunk_result(idx: int, chunk_text: str, text_results: dict, image_ids: list) -> dict:
+    return {
+        "chunk_index": idx,
+        "chunk_text": chunk_text,
+        "text_analysis": text_results[chunk_text] if chunk_text.strip() else None,
+        # Ids into the document-level "images" table
+        "image_analysis": image_ids
+    }
+
+
+def _sampling_order(count: int, seed: str) -> list[int]:
+    """
+    Chunk indices 0..count-1 in stratified random order: the document is cut
+    into about sqrt(count) runs of consecutive chunks, each run is shuffled and
+    the runs are interleaved, so every prefix of the order spreads over the
+    whole document. The same seed gives the same order.
+    """
+    rng = random.Random(seed)
+    size = max(1, math.isqrt(count))
+    strata = [list(range(start, min(count, start + size))) for start in range(0, count, size)]
+    for stratum in strata:
+        rng.shuffle(stratum)
+    return [stratum[i] for i in range(size) for stratum in strata if i < len(stratum)]
+
+
+def _score_interval(scores: list[float], population: int) -> tuple[float, float]:
+    """
+    Mean of sampled chunk scores and the half-width of its ADAPTIVE_CONFIDENCE
+    interval, corrected for sampling without replacement from `population`
+    chunks (0 once every chunk is scored).
+    """
+    count = len(scores)
+    mean = sum(scores) / count
+    if count < 2:
+        return mean, math.inf
+    variance = sum((score - mean) ** 2 for score in scores) / (count - 1)
+    correction = (population - count) / (population - 1) if population > 1 else 0.0
+    return mean, ADAPTIVE_Z * math.sqrt(max(0.0, variance / count * correction))
+
+
+def _analyze_sampled(chunk_texts: list[str], image_table: dict, chunk_image_ids: list, refresh: bool,
+                     tolerance: float, seed: str) -> tuple[list, dict, dict, bool, dict]:
+    """
+    Adaptive analysis: non-empty chunks in _sampling_order, ADAPTIVE_BATCH at a
+    time, until at least ADAPTIVE_MIN_CHUNKS are scored and the document's mean
+    ai_like_score is known to within ±tolerance. Only the images of sampled
+    chunks are analyzed. Returns (sampled chunk indices in document order,
+    {text: analysis}, {image id: analysis}, failed, sampling summary).
+    """
+    order = [idx for idx in _sampling_order(len(chunk_texts), seed) if chunk_texts[idx].strip()]
+    sampled, scores = [], []
+    text_results, images, failed = {}, {}, False
+    mean, half_width = None, math.inf
+
+    for start in range(0, len(order), ADAPTIVE_BATCH):
+        batch = order[start:start + ADAPTIVE_BATCH]
+        batch_images = {img_id: image_table.get(img_id, img_id)
+                        for idx in batch for img_id in chunk_image_ids[idx] if img_id not in images}
+        batch_texts, batch_analyses, batch_failed = _analyze_batch([chunk_texts[idx] for idx in batch], batch_images, refresh)
+        text_results.update(batch_texts)
+        images.update(batch_analyses)
+        failed = failed or batch_failed
+
+        sampled.extend(batch)
+        # Every chunk is one sample, repeated boilerplate included
+        scores.extend(text_results[chunk_texts[idx]]["ai_like_score"] for idx in batch
+                      if "ai_like_score" in text_results[chunk_texts[idx]])
+        if scores:
+            mean, half_width = _score_interval(scores, len(order))
+        if len(sampled) >= ADAPTIVE_MIN_CHUNKS and half_width <= tolerance:
+            break
+
+    summary = {
+        "mode": "adaptive",
+        "tolerance": tolerance,
+        "confidence": ADAPTIVE_CONFIDENCE,
+        "chunks_total": len(chunk_texts),
+        "chunks_sampled": len(sampled),
+        "images_total": len(image_table),
+        "images_sampled": len(images),
+        "stopped_early": len(sampled) < len(order),
+        "ai_like_score": round(mean, 3) if mean is not None else None,
+        "interval": [round(max(0.0, mean - half_width), 3), round(min(1.0, mean + half_width), 3)] if mean is not None else None
+    }
+    return sorted(sampled), text_results, images, failed, summary
+
+
+def _analyze_document(filename: str, refresh: bool, cloud_segments: int, max_words: int, overlap: int, span_pages: bool,
+                      tolerance: float | None = None, userId: str | None = None, username: str | None = None) -> dict:
+    """
+    Response data for analyze_file: per-chunk results, the image table and the verdict.
+    With a tolerance, chunks are sampled adaptively (_analyze_sampled): only
+    sampled chunks and their images appear, with a "sampling" summary, and the
+    near-duplicate document check, which needs all of the text, is skipped.
+    Otherwise "near_duplicates" lists the owner's similar documents when
+    userId and username name the document's owner.
+    """
+    sampling = f".a{tolerance}" if tolerance is not None else ""
+    filename, file_path, data, document_key, cached = _open_document(
+        filename, refresh, cloud_segments, max_words, overlap, span_pages, sampling)
+    scope = _document_scope(filename, userId, username)
+    if cached is not None:
+        if tolerance is not None:
+            return cached
+        return {**cached, "near_duplicates": _near_duplicate_documents(scope, cached=True)}
+
     # Automatically chunk if missing
     if "chunks" not in data:
         try:
-            data = chunk_text_from_json(file_path)
+            with timed("chunk"):
+                data = chunk_text_from_json(file_path, max_words, overlap, span_pages)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to chunk JSON: {str(e)}")
 
-    results = []
-
-    for idx, chunk in enumerate(data["chunks"]):
-        # Use the key from chunk_text_from_json ("chunk")
-        chunk_text = chunk.get("chunk", "")
-
-        chunk_result = {
-            "chunk_index": idx,
-            "chunk_text": chunk_text,
-            "text_analysis": None,
-            "image_analysis": []
-        }
-
-        # --- Text analysis ---
-        if chunk_text.strip():
-            chunk_result["text_analysis"] = analyze_text(chunk_text)
-
-        # --- Image analysis ---
-        images = chunk.get("images", [])
-        for img_info in images:
-            # Handle dict or str
-            if isinstance(img_info, dict):
-                img_path = img_info.get("path")
-            elif isinstance(img_info, str):
-                img_path = os.path.join(IMAGES_DIR, img_info)
-            else:
-                img_path = None
+    # Use the key from chunk_text_from_json ("chunk")
+    chunk_texts = [chunk.get("chunk", "") for chunk in data["chunks"]]
+
+    # Every unique image is analyzed once; chunks refer to the table by id
+    image_table, chunk_image_ids = _image_table(data)
+    if tolerance is not None:
+        sampled, text_results, images, failed, summary = _analyze_sampled(
+            chunk_texts, image_table, chunk_image_ids, refresh, tolerance, document_key)
+    else:
+        sampled, summary = range(len(chunk_texts)), None
+        text_results, images, failed = _analyze_batch(chunk_texts, image_table, refresh)
+
+    results = [_chunk_result(idx, chunk_texts[idx], text_results, chunk_image_ids[idx]) for idx in sampled]
+
+    # Leading chunks go to the cloud detector as separate, concurrent segments
+    cloud_segments_text = chunk_texts[:cloud_segments] or [""]
+
+    verdict = _cloud_verdict(cloud_segments_text, refresh)
+
+    response_data = {
+        "filename": filename,
+        "results": results,
+        "images": images,
+        "Verdict" : verdict
+    }
+    if summary is not None:
+        response_data["sampling"] = summary
+    if verdict.get("verdict") != CLOUD_ERROR_VERDICT and not failed:
+        cache_put(document_key, response_data)
+
+    if summary is not None:
+        return response_data
+    return {**response_data, "near_duplicates": _near_duplicate_documents(scope, minhash(chunk_texts) if MINHASH_REUSE else None)}
+
+
+def _analyze_upload(data: bytes, file_hash: str, file_name: str, file_ext: str, persist: bool, refresh: bool,
+                    cloud_segments: int, max_words: int, overlap: int, span_pages: bool, userId: str, username: str) -> dict:
+    """
+    Response data for analyze_upload: extraction, chunking and analysis of an
+    upload held in memory. Nothing is written to disk unless persist is set.
+    """
+    # Keyed by the upload's own digest, so a repeat upload skips extraction too.
+    # Image ids embed the per-user file name, so the name is part of the key:
+    # the same bytes from another user must not come back with this user's ids.
+    chunking = f"w{max_words}.o{overlap}.p{int(span_pages)}"
+    document_key = cache_key("upload", f"{DOCUMENT_VERSION}.s{cloud_segments}.{chunking}.{file_ext}",
+                             content_digest(f"{file_hash}/{file_name}"))
+    # Persisting has to extract and write the files, and its image ids come from
+    # the image store, so it neither reads nor fills this cache
+    cached = None if refresh or persist else cache_get(document_key)
+    if cached is not None:
+        scope = _document_scope(file_name, userId, username)
+        return {**cached, "near_duplicates": _near_duplicate_documents(scope, cached=True)}
+
+    with timed("extract"):
+        pages, output_file = extract_document_bytes(data, file_name, file_ext, persist)
+
+    image_table = {image_id(img): img for page in pages for img in page["images"]}
+    with timed("chunk"):
+        chunks = list(iter_chunks(pages, max_words, overlap, span_pages))
+    chunk_texts = [chunk["chunk"] for chunk in chunks]
+
+    text_results, images, failed = _analyze_batch(chunk_texts, image_table, refresh)
+    results = [_chunk_result(idx, chunk["chunk"], text_results, chunk["images"]) for idx, chunk in enumerate(chunks)]
+    verdict = _cloud_verdict(chunk_texts[:cloud_segments] or [""], refresh)
+
+    response_data = {
+        "file_name": file_name,
+        "file_hash": file_hash,
+        "output_file": output_file,
+        "results": results,
+        "images": images,
+        "Verdict": verdict
+    }
+    if verdict.get("verdict") != CLOUD_ERROR_VERDICT and not failed and not persist:
+        cache_put(document_key, response_data)
+
+    # A persisted upload is the document of its page pack, which /analyze/ indexes too
+    scope = _document_scope(output_file or file_name, userId, username)
+    return {**response_data, "near_duplicates": _near_duplicate_documents(scope, minhash(chunk_texts) if MINHASH_REUSE else None)}
+
+
+def _iter_document_chunks(file_path: str, data, max_words: int, overlap: int, span_pages: bool, image_table: dict):
+    """
+    Yield (chunk, image ids) lazily. image_table fills with {id: record} as
+    pages stream past, always before a chunk that refers to those images.
+    """
+    if isinstance(data, dict) and "chunks" in data:
+        table, chunk_image_ids = _image_table(data)
+        image_table.update(table)
+        yield from zip(data["chunks"], chunk_image_ids)
+        return
+
+    def collect_images(pages):
+        for page in pages:
+            for img in page.get("images", []):
+                image_table.setdefault(image_id(img), img)
+            yield page
+
+    pages = data if isinstance(data, list) else iter_pages(file_path)
+    for chunk in iter_chunks(collect_images(pages), max_words, overlap, span_pages):
+        yield chunk, chunk["images"]
+
+
+def _iter_analysis_events(filename: str, file_path: str, data, refresh: bool, cloud_segments: int,
+                          max_words: int, overlap: int, span_pages: bool, scope: tuple[str, str | None]):
+    """
+    (event, payload) pairs for a streamed analysis: "start", then each image the
+    first time a chunk refers to it and each chunk as soon as its batch is
+    scored, then "verdict" and "end". The cloud call starts in the background
+    as soon as the leading segments are known.
+    """
+    yield "start", {"filename": filename}
+
+    image_table = {}
+    sent_images = set()
+    segments = []
+    index = 0
+    signature = None
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="cloud-verdict") as cloud_pool:
+        cloud_future = None
+        chunks = _iter_document_chunks(file_path, data, max_words, overlap, span_pages, image_table)
 
-            if img_path and os.path.exists(img_path):
-                try:
-                    img_result = image_inspector(img_path)
-                except Exception as e:
-                    img_result = {"error": f"Failed to analyze image: {str(e)}", "file": img_info}
+        while True:
+            with timed("chunk"):
+                batch = list(islice(chunks, STREAM_BATCH))
+            if not batch:
+                break
+
+            chunk_texts = [chunk.get("chunk", "") for chunk, _ in batch]
+            if MINHASH_REUSE:
+                signature = minhash(chunk_texts, into=signature)
+            if cloud_future is None:
+                segments.extend(chunk_texts[:cloud_segments - len(segments)])
+                if len(segments) >= cloud_segments:
+                    cloud_future = cloud_pool.submit(contextvars.copy_context().run, _cloud_verdict, segments, refresh)
+
+            new_images = {img_id: image_table.get(img_id, img_id)
+                          for _, ids in batch for img_id in ids if img_id not in sent_images}
+            text_results, images, _ = _analyze_batch(chunk_texts, new_images, refresh)
+
+            for img_id, analysis in images.items():
+                sent_images.add(img_id)
+                yield "image", {"id": img_id, "analysis": analysis}
+            for (_, image_ids), chunk_text in zip(batch, chunk_texts):
+                yield "chunk", _chunk_result(index, chunk_text, text_results, image_ids)
+                index += 1
+
+        if cloud_future is None:
+            cloud_future = cloud_pool.submit(contextvars.copy_context().run, _cloud_verdict, segments or [""], refresh)
+        yield "verdict", {"Verdict": cloud_future.result()}
+
+    yield "end", {"chunks": index, "images": len(sent_images), "near_duplicates": _near_duplicate_documents(scope, signature)}
+
+
+def _iter_cached_events(cached: dict, scope: tuple[str, str | None]):
+    # Replay a whole-document cache hit in the same event order
+    yield "start", {"filename": cached["filename"]}
+    for img_id, analysis in cached.get("images", {}).items():
+        yield "image", {"id": img_id, "analysis": analysis}
+    for chunk_result in cached.get("results", []):
+        yield "chunk", chunk_result
+    yield "verdict", {"Verdict": cached.get("Verdict")}
+    yield "end", {"chunks": len(cached.get("results", [])), "images": len(cached.get("images", {})),
+                  "near_duplicates": _near_duplicate_documents(scope, cached=True)}
+
+
+def _encode_events(events, fmt: str):
+    try:
+        for event, payload in events:
+            if fmt == "sse":
+                yield b"event: " + event.encode() + b"\ndata: " + orjson.dumps(payload) + b"\n\n"
             else:
-                img_result = {"error": "Image not found", "file": img_info}
+                yield orjson.dumps({"event": event, **payload}, option=orjson.OPT_APPEND_NEWLINE)
+    except Exception as e:
+        # Headers are already sent; report the failure in-band
+        detail = {"detail": f"Analysis failed: {str(e)}"}
+        if fmt == "sse":
+            yield b"event: error\ndata: " + orjson.dumps(detail) + b"\n\n"
+        else:
+            yield orjson.dumps({"event": "error", **detail}, option=orjson.OPT_APPEND_NEWLINE)
 
-            # Use stringified key for consistency
-            chunk_result["image_analysis"].append({str(img_info): img_result})
 
-        results.append(chunk_result)
+@router.get("/")
+def analyze_file(request: Request, filename: str = Query(..., description="Base filename (with or without .pack/.json/.ndjson)"),
+                 refresh: bool = Query(False, description="Ignore cached results and recompute"),
+                 cloud_segments: int = Query(1, ge=1, description="Number of leading chunks sent to the cloud detector"),
+                 max_words: int = Query(450, ge=1, description="Word budget per chunk"),
+                 overlap: int = Query(0, ge=0, description="Words of whole sentences repeated between neighbouring chunks"),
+                 span_pages: bool = Query(False, description="Let chunks continue across page breaks"),
+                 mode: str = Query("full", pattern="^(full|adaptive)$", description="full scores every chunk; adaptive samples until the score is stable"),
+                 tolerance: float = Query(0.05, gt=0, lt=1, description="Adaptive mode: stop once the mean ai_like_score is known to ± this"),
+                 userId: str | None = Query(None, description="Owner of the document; enables the near-duplicate check"),
+                 username: str | None = Query(None, description="Owner of the document; enables the near-duplicate check"),
+                 profile: bool = Query(False, description="Attach a per-stage and per-function timing breakdown")):
+    """
+    Analyze chunks of text and images from a processed JSON file.
+    Automatically chunks JSON if 'chunks' key is missing.
+    Returns actual chunk text along with text and image analysis results.
+    Each unique image is analyzed once into a document-level "images" table;
+    a chunk's "image_analysis" lists the ids of its images in that table.
+    Results are cached by content hash: an unchanged document is answered from
+    the cache and a partly changed one only re-scores its changed chunks/images.
+    With profile=1 the response carries a "profile" breakdown of where the time went.
+    With mode=adaptive, chunks are scored in a stratified random order until the
+    document's mean ai_like_score is known to ±tolerance (95% interval); only
+    the sampled chunks are returned, and "sampling" says how much was scored.
+    With the owner's userId and username, "near_duplicates" lists that owner's
+    documents with nearly the same text.
+    """
+    args = (filename, refresh, cloud_segments, max_words, overlap, span_pages, tolerance if mode == "adaptive" else None,
+            userId, username)
+    with timed("analyze"):
+        if profile:
+            response_data, breakdown = profile_call(_analyze_document, *args)
+            response_data = {**response_data, "profile": breakdown}
+        else:
+            response_data = _analyze_document(*args)
+
+    return JSONResponse(ApiResponse(
+        status="success",
+        message=f"Analysis completed for {response_data['filename']}",
+        data=response_data,
+        request=request
+    ))
+
+
+@router.get("/stream")
+def analyze_file_stream(filename: str = Query(..., description="Base filename (with or without .pack/.json/.ndjson)"),
+                        refresh: bool = Query(False, description="Ignore cached results and recompute"),
+                        cloud_segments: int = Query(1, ge=1, description="Number of leading chunks sent to the cloud detector"),
+                        max_words: int = Query(450, ge=1, description="Word budget per chunk"),
+                        overlap: int = Query(0, ge=0, description="Words of whole sentences repeated between neighbouring chunks"),
+                        span_pages: bool = Query(False, description="Let chunks continue across page breaks"),
+                        fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$", description="ndjson or sse"),
+                        userId: str | None = Query(None, description="Owner of the document; enables the near-duplicate check"),
+                        username: str | None = Query(None, description="Owner of the document; enables the near-duplicate check")):
+    """
+    Same analysis as GET /analyze/, streamed as it is computed: NDJSON lines
+    ({"event": ..., ...}) or server-sent events. Events are "start", "image"
+    (once per image id), "chunk" (in order, as each small batch is scored),
+    "verdict" (the cloud verdict, last) and "end"; "error" if it fails midway.
+    Chunks are read and scored incrementally, so the first results arrive
+    before the rest of the document has been chunked.
+    """
+    filename, file_path, data, _, cached = _open_document(
+        filename, refresh, cloud_segments, max_words, overlap, span_pages)
+    scope = _document_scope(filename, userId, username)
+
+    if cached is not None:
+        events = _iter_cached_events(cached, scope)
+    else:
+        events = _iter_analysis_events(filename, file_path, data, refresh, cloud_segments, max_words, overlap, span_pages, scope)
+
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return StreamingResponse(_encode_events(events, fmt), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    cloud_intializer = " ".join([ chunk.get("chunk", "") for idx, chunk in enumerate(data.get("chunks", [])) if idx < 1 ])
 
+# The body is parsed by read_multipart_upload, not by FastAPI, so it is described here
+UPLOAD_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}}}}}}
 
-    verdict = cloud_init(cloud_intializer)
 
-    
+@router.post("/upload", openapi_extra=UPLOAD_BODY)
+async def analyze_upload(request: Request, userId: str, username: str,
+                         persist: bool = Query(False, description="Also save the upload, its images and a page pack"),
+                         refresh: bool = Query(False, description="Ignore cached results and recompute"),
+                         cloud_segments: int = Query(1, ge=1, description="Number of leading chunks sent to the cloud detector"),
+                         max_words: int = Query(450, ge=1, description="Word budget per chunk"),
+                         overlap: int = Query(0, ge=0, description="Words of whole sentences repeated between neighbouring chunks"),
+                         span_pages: bool = Query(False, description="Let chunks continue across page breaks")):
+    """
+    Upload a PDF or DOCX (multipart field "file") and analyze it in one request,
+    entirely in memory: the form is parsed without spooling to a temp file, the
+    document is opened from the upload bytes and extracted images go straight
+    to the inspector, so nothing touches disk. Returns the same results, images
+    and Verdict as GET /analyze/. With persist=true the upload, images and page
+    pack are also saved as /document/upload would ("output_file" names the pack).
+    Uploads over MEMORY_UPLOAD_MAX_BYTES are refused with 413, from the
+    Content-Length before the body is read when the client sends one.
+    """
+    if overlap >= max_words:
+        raise HTTPException(status_code=400, detail="overlap must be smaller than max_words")
+
+    try:
+        upload_name, data, file_hash = await read_multipart_upload(request, "file", MEMORY_UPLOAD_MAX_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    file_name, file_ext = os.path.splitext(upload_name)
+    file_ext = file_ext.lower()
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+
+    new_filename = f"{file_name}_{username}_{userId}{file_ext}"
+
+    started = time.perf_counter()
+    try:
+        response_data = await run_in_threadpool(_analyze_upload, data, file_hash, new_filename, file_ext, persist, refresh,
+                                                cloud_segments, max_words, overlap, span_pages, userId, username)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+    observe("analyze", time.perf_counter() - started)
 
     return JSONResponse(ApiResponse(
         status="success",
-        message=f"Analysis completed for {filename}",
-        data={
-            "filename": filename,
-            "results": results,
-            "Verdict" : verdict
-        },
+        message=f"Analysis completed for {response_data['file_name']}",
+        data=response_data,
         request=request
     ))
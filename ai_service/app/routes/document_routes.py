@@ -1,58 +1,120 @@
 import os
 import time
-from fastapi import APIRouter, UploadFile, HTTPException, Request
-from app.services.chunk_service import chunk_text_from_json
-from app.services.docx_service import extract_docx_content
-from app.services.pdf_service import extract_pdf_content
-from app.utils.json_utils import load_json
-from app.utils.file_utils import save_file
+from fastapi import APIRouter, UploadFile, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from app.services.document_service import SUPPORTED_EXTENSIONS, process_document
+from app.services.job_service import QueueFullError, get_job, get_job_result, has_capacity, submit_job
+from app.utils.file_utils import save_file_with_digest
+from app.utils.metrics import observe, profile_call
 from app.api.ApiResponse import ApiResponse
 
 router = APIRouter(prefix="/document", tags=["document"])
 
 @router.post("/upload")
-async def upload_document(request: Request, file: UploadFile, userId: str, username: str, max_words: int = 450):
+async def upload_document(request: Request, file: UploadFile, userId: str, username: str, max_words: int = Query(450, ge=1),
+                          stream: bool = False, overlap: int = Query(0, ge=0), span_pages: bool = False, profile: bool = False):
     """
     Upload a PDF or DOCX, rename it, extract content, chunk text, and return chunks + images.
+    Chunks end at sentence boundaries; `overlap` repeats up to that many words of
+    whole sentences between neighbouring chunks and span_pages lets chunks cross pages.
+    With stream=true, pages are extracted one at a time into NDJSON and only
+    chunk/image counts are returned, keeping memory flat for very large files.
+    With profile=1 the response carries a "profile" breakdown of extraction and chunking.
     """
+    if overlap >= max_words:
+        raise HTTPException(status_code=400, detail="overlap must be smaller than max_words")
+
     try:
         # Extract original filename and extension
         file_name, file_ext = os.path.splitext(file.filename)
         file_ext = file_ext.lower()
 
-        if file_ext not in [".pdf", ".docx"]:
+        if file_ext not in SUPPORTED_EXTENSIONS:
             raise HTTPException(status_code=400, detail="Unsupported file type")
 
         # Rename file before saving
         new_filename = f"{file_name}_{username}_{userId}{file_ext}"
-        file_path = await save_file(file, custom_filename=new_filename)
+        started = time.perf_counter()
+        file_path, file_hash = await save_file_with_digest(file, custom_filename=new_filename)
+        observe("upload_save", time.perf_counter() - started)
+
+        # Extraction and chunking block, so keep them off the event loop
+        args = (file_path, new_filename, file_ext, max_words, stream, overlap, span_pages)
+        if profile:
+            response_data, breakdown = await run_in_threadpool(profile_call, process_document, *args)
+            response_data["profile"] = breakdown
+        else:
+            response_data = await run_in_threadpool(process_document, *args)
+        response_data["file_hash"] = file_hash
 
-        # Extract content
-        if file_ext == ".pdf":
-            output_json_path = extract_pdf_content(file_path)
-            time.sleep(0.9)
-            json_data = load_json(output_json_path)
+        action = "streamed" if stream else "processed"
+        return ApiResponse("success", f"{file_ext.upper()} {action} successfully", response_data, request)
 
-        elif file_ext == ".docx":
-            output_json_path = extract_docx_content(file_path)
-            time.sleep(0.9)
-            json_data = load_json(output_json_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
-        # Chunk text
-        chunks = chunk_text_from_json(output_json_path, max_words=max_words)
-        time.sleep(0.9)
 
-        
+@router.post("/jobs", status_code=202)
+async def create_upload_job(request: Request, file: UploadFile, userId: str, username: str, max_words: int = Query(450, ge=1),
+                            stream: bool = False, overlap: int = Query(0, ge=0), span_pages: bool = False):
+    """
+    Upload a PDF or DOCX and process it in the background.
+    Returns a job id right away; poll /document/jobs/{job_id} for status and
+    /document/jobs/{job_id}/result for the same data /document/upload returns.
+    Responds 429 when the upload queue is full.
+    """
+    file_name, file_ext = os.path.splitext(file.filename)
+    file_ext = file_ext.lower()
 
-        # Prepare response
-        response_data = {
-            "file_name": new_filename,
-            "file_extension": file_ext,
-            "chunks": chunks["chunks"],
-            "images": chunks["images"]
-        }
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    if overlap >= max_words:
+        raise HTTPException(status_code=400, detail="overlap must be smaller than max_words")
 
-        return ApiResponse("success", f"{file_ext.upper()} processed successfully", response_data, request)
+    # Refuse before saving the upload when the queue is already full. The body
+    # itself has already been received: FastAPI parses the form (spooling large
+    # files to a temp file) before this handler runs.
+    if not has_capacity():
+        raise HTTPException(status_code=429, detail="Upload queue is full, retry later", headers={"Retry-After": "5"})
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
\ No newline at end of file
+    new_filename = f"{file_name}_{username}_{userId}{file_ext}"
+    file_path, file_hash = await save_file_with_digest(file, custom_filename=new_filename)
+
+    try:
+        job_id = submit_job(process_document, file_path, new_filename, file_ext, max_words, stream, overlap, span_pages)
+    except QueueFullError as e:
+        os.remove(file_path)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+    return ApiResponse("success", "Upload accepted", {"job_id": job_id, "file_name": new_filename, "file_hash": file_hash, "status": "queued"}, request)
+
+
+@router.get("/jobs/{job_id}")
+def get_upload_job(request: Request, job_id: str):
+    """
+    Status of a background upload job.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+
+    return ApiResponse("success", f"Job is {job['status']}", job, request)
+
+
+@router.get("/jobs/{job_id}/result")
+def get_upload_job_result(request: Request, job_id: str):
+    """
+    Result of a finished upload job; 202 while it is still queued or running.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+
+    if job["status"] in ("queued", "running"):
+        return JSONResponse(ApiResponse("pending", f"Job is {job['status']}", job, request), status_code=202)
+
+    if job["status"] == "failed":
+        return JSONResponse(ApiResponse("error", f"Error processing file: {job['error']}", job, request), status_code=500)
+
+    return JSONResponse(ApiResponse("success", "Job completed", get_job_result(job_id), request))
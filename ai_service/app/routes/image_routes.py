@@ -2,6 +2,8 @@ import os
 from fastapi import APIRouter, Query, Request, HTTPException
 from fastapi.responses import FileResponse, JSONResponse
 from app.api.ApiResponse import ApiResponse  # Global API response
+from app.services.image_service import IMAGE_EXTENSIONS, IMAGE_FIELDS, list_images, sync_image_index
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, owner_pattern, parse_fields
 
 IMAGES_DIR = "images"
 os.makedirs(IMAGES_DIR, exist_ok=True)
@@ -10,25 +12,25 @@ router = APIRouter(prefix="/images", tags=["images"])
 
 
 @router.get("/")
-def get_images(request: Request, filename: str | None = Query(default=None, description="Base filename to filter (without _image_X)")):
+def get_images(request: Request, filename: str | None = Query(default=None, description="Base filename to filter (without _image_X)"),
+               prefix: str | None = Query(default=None, description="List only images whose name starts with this"),
+               userId: str | None = Query(default=None, description="List only images from this user id's uploads"),
+               username: str | None = Query(default=None, description="List only images from this username's uploads"),
+               fields: str | None = Query(default=None, description=f"Comma-separated fields to return: url, {', '.join(IMAGE_FIELDS)}"),
+               cursor: str | None = Query(default=None, description="next_cursor from the previous page"),
+               limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
     """
-    List all available images or filter by base filename.
+    List available images from the image index, or filter by base filename.
+    Results are paginated: pass the returned next_cursor to get the next page.
+    Without `fields`, "images" is a list of URLs; with it, a list of objects.
     """
-    if not os.path.exists(IMAGES_DIR):
-        return JSONResponse(ApiResponse(
-            status="error",
-            message="Images directory not found",
-            data=None,
-            request=request
-        ), status_code=404)
-
-    files = os.listdir(IMAGES_DIR)
-    images = [f for f in files if f.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp"))]
-
-    if filename:
-        images = [img for img in images if img.startswith(f"{filename}_image_")]
+    selected = parse_fields(fields, ("url",) + IMAGE_FIELDS)
+    sync_image_index()
+    rows = list_images(filename, prefix, owner_pattern(userId, username), decode_cursor(cursor), limit + 1)
+    next_cursor = encode_cursor(rows[limit - 1]["name"]) if len(rows) > limit else None
+    rows = rows[:limit]
 
-    if not images:
+    if not rows and cursor is None:
         return JSONResponse(ApiResponse(
             status="error",
             message=f"No images found for '{filename}'" if filename else "No images found",
@@ -37,12 +39,17 @@ def get_images(request: Request, filename: str | None = Query(default=None, desc
         ), status_code=404)
 
     base_url = str(request.base_url).rstrip("/")
-    image_urls = [f"{base_url}/images/file/{img}" for img in images]
+    if selected is None:
+        images = [f"{base_url}/images/file/{row['name']}" for row in rows]
+    else:
+        for row in rows:
+            row["url"] = f"{base_url}/images/file/{row['name']}"
+        images = [{f: row[f] for f in selected} for row in rows]
 
     return JSONResponse(ApiResponse(
         status="success",
         message="Images retrieved successfully",
-        data={"images": image_urls},
+        data={"images": images, "next_cursor": next_cursor},
         request=request
     ))
 
@@ -50,11 +57,12 @@ def get_images(request: Request, filename: str | None = Query(default=None, desc
 @router.get("/file/{image_name}")
 def get_image(request: Request, image_name: str):
     """
-    Serve an image file by its name.
+    Serve an image file by its name. Only image files are served; anything
+    else in the image directory answers 404 like a missing image.
     """
     image_path = os.path.join(IMAGES_DIR, image_name)
 
-    if not os.path.exists(image_path):
+    if not image_name.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(image_path):
         return JSONResponse(ApiResponse(
             status="error",
             message=f"Image '{image_name}' not found",
@@ -1,8 +1,10 @@
 import os
-import orjson
 from fastapi import APIRouter, Query, HTTPException, Request
 from fastapi.responses import JSONResponse
 from app.api.ApiResponse import ApiResponse  
+from app.utils.json_utils import OUTPUT_EXTENSIONS, PageReader, find_output_file, load_json
+from app.utils.output_index import OUTPUT_FIELDS, list_outputs, sync_output_index
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, owner_pattern, parse_fields
 
 OUTPUT_DIR = "output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -10,33 +12,57 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 router = APIRouter( tags=["load json"])
 
 @router.get("/get_files")
-def get_json_files(request: Request, file_name: str | None = Query(default=None, description="Optional filename (with or without .json)")):
+def get_json_files(request: Request, file_name: str | None = Query(default=None, description="Optional filename (with or without .pack/.json/.ndjson)"),
+                   page: int | None = Query(default=None, ge=0, description="Only return the page record at this index"),
+                   prefix: str | None = Query(default=None, description="List only files whose name starts with this"),
+                   userId: str | None = Query(default=None, description="List only files uploaded by this user id"),
+                   username: str | None = Query(default=None, description="List only files uploaded by this username"),
+                   fields: str | None = Query(default=None, description=f"Comma-separated fields to return: {', '.join(OUTPUT_FIELDS)}, data"),
+                   cursor: str | None = Query(default=None, description="next_cursor from the previous page"),
+                   limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    """
+    Load one extraction output, or list outputs from the metadata index.
+    Listings are paginated: pass the returned next_cursor to get the next page.
+    File contents are only loaded when "data" is among the requested fields.
+    """
     if file_name:
-        # Normalize filename (allow with or without .json)
-        if not file_name.lower().endswith(".json"):
-            file_name = f"{file_name}.json"
-        file_path = os.path.join(OUTPUT_DIR, file_name)
-
-        if not os.path.exists(file_path):
+        # Normalize filename (allow with or without extension)
+        resolved = find_output_file(file_name)
+        if resolved is None:
             raise HTTPException(status_code=404, detail=f"File '{file_name}' not found in output/")
+        file_name = resolved
+        file_path = os.path.join(OUTPUT_DIR, file_name)
 
         try:
-            with open(file_path, "rb") as f:
-                data = orjson.loads(f.read())
-            return JSONResponse(ApiResponse("success", f"File '{file_name}' loaded", data, request))
+            if page is not None and file_name.lower().endswith(".pack"):
+                # Packs are indexed: decode just the requested page
+                with PageReader(file_path) as reader:
+                    data = reader[page] if page < len(reader) else None
+            else:
+                data = load_json(file_path)
+                if page is not None:
+                    data = data[page] if isinstance(data, list) and page < len(data) else None
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error reading {file_name}: {str(e)}")
 
-    # No param → return all JSONs
-    all_data = []
-    for file in os.listdir(OUTPUT_DIR):
-        if file.lower().endswith(".json"):
-            file_path = os.path.join(OUTPUT_DIR, file)
+        if page is not None and data is None:
+            raise HTTPException(status_code=404, detail=f"Page {page} not found in '{file_name}'")
+        return JSONResponse(ApiResponse("success", f"File '{file_name}' loaded", data, request))
+
+    # No file → one page of the metadata index
+    selected = parse_fields(fields, OUTPUT_FIELDS + ("data",)) or OUTPUT_FIELDS
+    sync_output_index(OUTPUT_EXTENSIONS)
+    rows = list_outputs(prefix, owner_pattern(userId, username), decode_cursor(cursor), limit + 1)
+    next_cursor = encode_cursor(rows[limit - 1]["file_name"]) if len(rows) > limit else None
+
+    files = []
+    for row in rows[:limit]:
+        item = {f: row[f] for f in selected if f != "data"}
+        if "data" in selected:
             try:
-                with open(file_path, "rb") as f:
-                    data = orjson.loads(f.read())
-                all_data.append({"file_name": file, "data": data})
+                item["data"] = load_json(os.path.join(OUTPUT_DIR, row["file_name"]))
             except Exception:
                 continue
+        files.append(item)
 
-    return JSONResponse(ApiResponse("success", "All JSON files loaded", all_data, request))
+    return JSONResponse(ApiResponse("success", "Files listed", {"files": files, "next_cursor": next_cursor}, request))
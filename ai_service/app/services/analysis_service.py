@@ -0,0 +1,252 @@
+import os
+import time
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from app.interceptors import text_interceptor, Image_interceptor
+from app.interceptors.text_interceptor import analyze_text_batch
+from app.interceptors.Image_interceptor import features_from_bytes, fingerprint_from_bytes, read_image_bytes
+from app.utils.metrics import observe, timed
+
+# Text scoring is pure-Python CPU work -> processes; image checks spend their
+# time in NumPy/PIL, which release the GIL -> threads.
+TEXT_WORKERS = int(os.getenv("ANALYZE_TEXT_WORKERS", "1"))
+IMAGE_WORKERS = int(os.getenv("ANALYZE_IMAGE_WORKERS", "4"))
+TEXT_TASK_TIMEOUT = float(os.getenv("ANALYZE_TEXT_TIMEOUT", "120"))
+IMAGE_TASK_TIMEOUT = float(os.getenv("ANALYZE_IMAGE_TIMEOUT", "30"))
+# Longest an image may wait for a free image worker, from submission
+IMAGE_QUEUE_TIMEOUT = float(os.getenv("ANALYZE_IMAGE_QUEUE_TIMEOUT", "120"))
+MIN_TEXT_BATCH = 16
+
+_pools_lock = threading.Lock()
+_text_pool = None
+_image_pool = None
+_image_pool_stuck = 0  # workers of _image_pool still busy with a timed-out task
+
+
+class TaskTimeout(Exception):
+    """A scheduled task did not finish within its timeout."""
+
+
+def _get_text_pool() -> ProcessPoolExecutor:
+    global _text_pool
+    with _pools_lock:
+        if _text_pool is None:
+            # spawn: the server process is multi-threaded, forking it is unsafe
+            _text_pool = ProcessPoolExecutor(max_workers=TEXT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _text_pool
+
+
+def _discard_text_pool(pool: ProcessPoolExecutor) -> None:
+    # A worker died: the pool refuses all work from now on, so the next caller gets a new one
+    global _text_pool
+    with _pools_lock:
+        if _text_pool is pool:
+            _text_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _get_image_pool() -> ThreadPoolExecutor:
+    global _image_pool, _image_pool_stuck
+    with _pools_lock:
+        if _image_pool is None:
+            _image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-analysis")
+            _image_pool_stuck = 0
+        return _image_pool
+
+
+def _image_task_timed_out(pool: ThreadPoolExecutor, future) -> None:
+    """
+    Count a worker of pool as stuck until its timed-out task returns. Once every
+    worker is stuck, nothing queued would ever start: the pool is replaced and
+    its queued tasks are cancelled, for their callers to resubmit. Threads
+    cannot be killed; the stuck ones finish (or hang) on their own.
+    """
+    global _image_pool, _image_pool_stuck
+    with _pools_lock:
+        if _image_pool is not pool:
+            return
+        _image_pool_stuck += 1
+        replace = _image_pool_stuck >= IMAGE_WORKERS
+        if replace:
+            _image_pool = None
+
+    if replace:
+        pool.shutdown(wait=False, cancel_futures=True)
+    else:
+        future.add_done_callback(lambda _: _image_task_returned(pool))
+
+
+def _image_task_returned(pool: ThreadPoolExecutor) -> None:
+    global _image_pool_stuck
+    with _pools_lock:
+        if _image_pool is pool:
+            _image_pool_stuck -= 1
+
+
+def warm_up() -> None:
+    """
+    Run the text and image checks once in this process and, with
+    ANALYZE_TEXT_WORKERS > 1, start every text worker and warm it up too, so
+    none of it happens on the first request.
+    """
+    text_interceptor.warm_up()
+    Image_interceptor.warm_up()
+    if TEXT_WORKERS > 1:
+        pool = _get_text_pool()
+        for future in [pool.submit(text_interceptor.warm_up) for _ in range(TEXT_WORKERS)]:
+            future.result(timeout=TEXT_TASK_TIMEOUT)
+
+
+def score_texts(texts: list[str]) -> list:
+    """
+    analyze_text_batch over texts, split across the text process pool.
+    Returns one entry per text in input order: the result dict, or a
+    TaskTimeout / exception instance for texts whose batch failed.
+    """
+    if not texts:
+        return []
+    if TEXT_WORKERS <= 1:
+        return analyze_text_batch(texts)
+
+    size = max(MIN_TEXT_BATCH, -(-len(texts) // TEXT_WORKERS))
+    batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+    # A broken pool is replaced and the texts retried once, then scored in-process
+    for _ in range(2):
+        pool = _get_text_pool()
+        try:
+            return _score_on_pool(pool, batches)
+        except BrokenProcessPool:
+            _discard_text_pool(pool)
+    return analyze_text_batch(texts)
+
+
+def _score_on_pool(pool: ProcessPoolExecutor, batches: list[list[str]]) -> list:
+    # Raises BrokenProcessPool if a worker died; other failures are per batch
+    futures = [pool.submit(analyze_text_batch, batch) for batch in batches]
+    deadline = time.monotonic() + TEXT_TASK_TIMEOUT
+
+    results = []
+    for batch, future in zip(batches, futures):
+        try:
+            results.extend(future.result(timeout=max(0.0, deadline - time.monotonic())))
+        except TimeoutError:
+            future.cancel()
+            results.extend([TaskTimeout("Text analysis timed out")] * len(batch))
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            results.extend([e] * len(batch))
+    return results
+
+
+def _inspect_image(source, near_lookup=None) -> dict:
+    # In-memory uploads hand over the image bytes instead of a path
+    data = source if isinstance(source, bytes) else read_image_bytes(source)
+    if near_lookup is None:
+        return features_from_bytes(data)
+
+    with timed("image_phash"):
+        fingerprint = fingerprint_from_bytes(data)
+        reused = near_lookup(fingerprint["dhash"], fingerprint["format"], fingerprint["bands"])
+    if reused is not None:
+        # Pixel statistics of a near-duplicate; format and EXIF are this file's own
+        return {**reused, **fingerprint}
+    return {**features_from_bytes(data), "dhash": fingerprint["dhash"]}
+
+
+def _submit_images(paths: dict, near_lookup=None):
+    """
+    Queue every image on the image pool. Returns (futures, started, submit):
+    {future: (key, pool)}, {key: start time} filled in as tasks start, and
+    submit(key) -> (future, pool) to queue one image again.
+    """
+    started = {}
+
+    def run(key, source):
+        started[key] = time.monotonic()
+        with timed("image_features"):
+            return _inspect_image(source, near_lookup)
+
+    def submit(key):
+        # Each task runs in a copy of the caller's context so per-request timings reach it
+        pool = _get_image_pool()
+        return pool.submit(contextvars.copy_context().run, run, key, paths[key]), pool
+
+    futures = {}
+    for key in paths:
+        future, pool = submit(key)
+        futures[future] = (key, pool)
+    return futures, started, submit
+
+
+def _collect_images(futures: dict, started: dict, submit) -> dict:
+    results = {}
+    pending = set(futures)
+    queue_deadline = time.monotonic() + IMAGE_QUEUE_TIMEOUT
+
+    while pending:
+        done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+        for future in done:
+            key, _ = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+
+        now = time.monotonic()
+        for future in list(pending):
+            key, pool = futures[future]
+            if future.cancelled():
+                # Its pool was replaced before the task started (wait() does not
+                # report such futures as done): queue it on the new pool
+                pending.discard(future)
+                retry, pool = submit(key)
+                futures[retry] = (key, pool)
+                pending.add(retry)
+            elif key in started:
+                if now - started[key] > IMAGE_TASK_TIMEOUT:
+                    # The worker thread finishes in the background; we stop waiting
+                    results[key] = TaskTimeout("Image analysis timed out")
+                    pending.discard(future)
+                    _image_task_timed_out(pool, future)
+            elif now > queue_deadline and future.cancel():
+                results[key] = TaskTimeout("Image analysis timed out waiting for a worker")
+                pending.discard(future)
+
+    return results
+
+
+def inspect_images(paths: dict, near_lookup=None) -> dict:
+    """
+    image_features for {key: path or image bytes} on the image thread pool.
+    Each task gets IMAGE_TASK_TIMEOUT seconds from the moment it starts running,
+    so one slow image cannot hold up the rest, and at most IMAGE_QUEUE_TIMEOUT
+    seconds from submission to start. A pool whose workers are all stuck on
+    timed-out images is replaced. Returns {key: features or exception}.
+
+    With near_lookup(dhash, format, bands) -> pixel features or None, each image is
+    fingerprinted first and only decoded in full when the lookup finds no
+    near-duplicate; features then also carry the image's "dhash".
+    """
+    if not paths:
+        return {}
+    return _collect_images(*_submit_images(paths, near_lookup))
+
+
+def analyze_concurrently(texts: list[str], image_paths: dict, near_lookup=None) -> tuple[list, dict]:
+    """
+    Score texts and inspect images at the same time on their own pools.
+    Returns (score_texts(texts), inspect_images(image_paths, near_lookup)).
+    """
+    started = time.perf_counter()
+    submitted = _submit_images(image_paths, near_lookup) if image_paths else None
+    with timed("text_scoring"):
+        text_results = score_texts(texts)
+    image_results = _collect_images(*submitted) if submitted else {}
+    if submitted:
+        observe("image_scoring", time.perf_counter() - started)
+    return text_results, image_results
@@ -0,0 +1,125 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import orjson
+
+# Persistent LRU cache for analysis results, keyed by content hash + detector version.
+CACHE_DIR = "cache"
+CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", os.path.join(CACHE_DIR, "analysis.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "200000"))
+CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "1") != "0"
+
+_lock = threading.Lock()
+_conn = None
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+            CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL, entries INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats (id, bytes, entries) VALUES (0, 0, 0);
+            CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                UPDATE stats SET bytes = bytes + NEW.size, entries = entries + 1 WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                UPDATE stats SET bytes = bytes - OLD.size, entries = entries - 1 WHERE id = 0;
+            END;
+        """)
+        _conn = conn
+    return _conn
+
+def content_digest(payload) -> str:
+    """SHA-256 hex digest of text (UTF-8) or bytes."""
+    data = payload.encode("utf-8") if isinstance(payload, str) else payload
+    return hashlib.sha256(data).hexdigest()
+
+def cache_key(kind: str, version: str, digest: str) -> str:
+    """Key for a result of the given kind and detector version over content with this digest."""
+    return f"{kind}:{version}:{digest}"
+
+def cache_get_many(keys) -> dict:
+    """
+    Return {key: value} for the keys present in the cache and mark them recently used.
+    """
+    keys = list(dict.fromkeys(keys))
+    if not CACHE_ENABLED or not keys:
+        return {}
+
+    found = {}
+    with _lock:
+        conn = _db()
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            for key, value in conn.execute(f"SELECT key, value FROM entries WHERE key IN ({marks})", batch):
+                found[key] = orjson.loads(value)
+        if found:
+            now = time.time()
+            conn.executemany("UPDATE entries SET last_access = ? WHERE key = ?", [(now, k) for k in found])
+    return found
+
+def cache_get(key: str):
+    return cache_get_many([key]).get(key)
+
+def cache_put_many(items: dict) -> None:
+    """
+    Store {key: value} pairs, then evict least recently used entries over the limits.
+    Values larger than the whole cache budget are skipped.
+    """
+    if not CACHE_ENABLED or not items:
+        return
+
+    now = time.time()
+    rows = []
+    for key, value in items.items():
+        blob = orjson.dumps(value)
+        if len(blob) <= CACHE_MAX_BYTES:
+            rows.append((key, blob, len(blob), now))
+
+    with _lock:
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Delete + insert (not REPLACE) so the stats triggers fire
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(r[0],) for r in rows])
+            conn.executemany("INSERT INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)", rows)
+            _evict(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+def cache_put(key: str, value) -> None:
+    cache_put_many({key: value})
+
+def _evict(conn: sqlite3.Connection) -> None:
+    oldest = "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access LIMIT ?)"
+
+    total_bytes, entries = conn.execute("SELECT bytes, entries FROM stats WHERE id = 0").fetchone()
+    if entries > CACHE_MAX_ENTRIES:
+        conn.execute(oldest, (entries - CACHE_MAX_ENTRIES,))
+        total_bytes, entries = conn.execute("SELECT bytes, entries FROM stats WHERE id = 0").fetchone()
+
+    while total_bytes > CACHE_MAX_BYTES and entries:
+        conn.execute(oldest, (64,))
+        total_bytes, entries = conn.execute("SELECT bytes, entries FROM stats WHERE id = 0").fetchone()
+
+def cache_stats() -> dict:
+    with _lock:
+        total_bytes, entries = _db().execute("SELECT bytes, entries FROM stats WHERE id = 0").fetchone()
+    return {"bytes": total_bytes, "entries": entries, "max_bytes": CACHE_MAX_BYTES, "max_entries": CACHE_MAX_ENTRIES}
@@ -1,40 +1,223 @@
+import os
+import re
 import orjson
+from app.utils.json_utils import iter_ndjson, iter_pack
 
-def chunk_text_from_json(json_file: str, max_words: int = 450):
+# Bumped whenever chunk boundaries change for the same input
+CHUNKER_VERSION = "2"
+
+# Same sentence boundaries as text_interceptor, so chunks never cut a sentence the analyzer sees
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+_WORD_RE = re.compile(r'\S+')
+
+def image_id(img_info) -> str:
+    """
+    Id of an image record: the record's "id", else its file name without extension.
+    Legacy string entries (plain file names in images/) are their own id.
+    """
+    if isinstance(img_info, dict):
+        return img_info.get("id") or os.path.splitext(os.path.basename(img_info.get("path", "")))[0]
+    return str(img_info)
+
+def _sentence_units(text: str, seq: int, max_words: int):
+    """
+    Yield (segments, words) units for one page: sentences as (seq, start, end)
+    character spans, with the same boundaries analyze_text uses. Sentences over
+    max_words are cut into max_words word windows.
+    """
+    lead = len(text) - len(text.lstrip())
+    stop = len(text.rstrip())
+    start = lead
+
+    for m in [*_SENTENCE_SPLIT_RE.finditer(text, lead, stop), None]:
+        end = m.start() if m else stop
+        if end > start:
+            words = len(text[start:end].split())
+            if words <= max_words:
+                yield ((seq, start, end),), words
+            else:
+                spans = [w.span() for w in _WORD_RE.finditer(text, start, end)]
+                for i in range(0, len(spans), max_words):
+                    window = spans[i:i + max_words]
+                    yield ((seq, window[0][0], window[-1][1]),), len(window)
+        if m:
+            start = m.end()
+
+def _ends_sentence(text: str, end: int) -> bool:
+    return end > 0 and text[end - 1] in ".!?"
+
+def iter_chunks(pages, max_words: int = 450, overlap: int = 0, span_pages: bool = False, include_text: bool = True):
+    """
+    Incrementally split page records into chunks.
+    Consumes any iterable of pages (list or generator) and yields chunk dicts,
+    so a streamed document is never held in memory as a whole.
+
+    Chunks are cut at sentence boundaries and hold at most max_words words
+    (a single longer sentence is cut into word windows). `overlap` repeats up
+    to that many words of trailing whole sentences at the start of the next
+    chunk. With span_pages, chunks fill across page breaks and a sentence cut
+    by a page break is kept together. Each chunk records character offsets:
+    "start" in its first page's text and "end" in its last page's ("end_page").
+    Runs in one pass, linear in the document size.
+
+    Chunks refer to their pages' images by id; the records themselves live
+    once in the document-level image list.
+    """
+    if max_words < 1:
+        raise ValueError("max_words must be at least 1")
+    if not 0 <= overlap < max_words:
+        raise ValueError("overlap must be between 0 and max_words - 1")
+
+    pages_by_seq = {}
+    chunk_counts = {}
+    buffer = []
+    buffer_words = 0
+    fresh = 0
+
+    def make_chunk():
+        segments = [segment for unit, _ in buffer for segment in unit]
+        first_seq, start, _ = segments[0]
+        last_seq, _, end = segments[-1]
+        first_page = pages_by_seq[first_seq]
+        page_no = first_page.get("page", 0)
+        chunk_counts[page_no] = chunk_counts.get(page_no, 0) + 1
+
+        chunk = {
+            "id": f"{page_no}_{chunk_counts[page_no]}",
+            "page": page_no,
+            "end_page": pages_by_seq[last_seq].get("page", 0),
+            "start": start,
+            "end": end
+        }
+        if include_text:
+            if first_seq == last_seq:
+                chunk["chunk"] = first_page.get("text", "")[start:end]
+            else:
+                # One slice per page touched, from its first to its last unit
+                bounds = {}
+                for seq, s, e in segments:
+                    lo, hi = bounds.get(seq, (s, e))
+                    bounds[seq] = (min(lo, s), max(hi, e))
+                chunk["chunk"] = "\n".join(pages_by_seq[seq].get("text", "")[s:e] for seq, (s, e) in bounds.items())
+
+        images = []
+        for seq in range(first_seq, last_seq + 1):
+            images.extend(image_id(img) for img in pages_by_seq[seq].get("images", []))
+        chunk["images"] = list(dict.fromkeys(images))  # ids into the document's image list
+        return chunk
+
+    def carry_overlap():
+        # Longest run of trailing whole units within `overlap` words, never the whole chunk
+        nonlocal buffer, buffer_words, fresh
+        kept, words = [], 0
+        for unit in reversed(buffer[1:]):
+            if words + unit[1] > overlap:
+                break
+            kept.append(unit)
+            words += unit[1]
+        buffer, buffer_words, fresh = kept[::-1], words, 0
+
+    def add(unit):
+        # Returns the chunk completed by adding this unit, if any
+        nonlocal buffer, buffer_words, fresh
+        chunk = None
+        if buffer_words + unit[1] > max_words:
+            if fresh:
+                chunk = make_chunk()
+                carry_overlap()
+            if buffer_words + unit[1] > max_words:
+                # Overlap that leaves no room for the next sentence is dropped
+                buffer, buffer_words = [], 0
+        buffer.append(unit)
+        buffer_words += unit[1]
+        fresh += 1
+        return chunk
+
+    def flush():
+        nonlocal buffer, buffer_words, fresh
+        chunk = make_chunk() if fresh else None
+        buffer, buffer_words, fresh = [], 0, 0
+        return chunk
+
+    pending = None
+    for seq, page in enumerate(pages):
+        pages_by_seq[seq] = page
+        text = page.get("text", "")
+        units = list(_sentence_units(text, seq, max_words))
+
+        if pending is not None:
+            # Glue the sentence cut by the page break back together when it fits
+            if units and pending[1] + units[0][1] <= max_words:
+                units[0] = (pending[0] + units[0][0], pending[1] + units[0][1])
+            else:
+                units.insert(0, pending)
+            pending = None
+
+        if span_pages and units:
+            last_seq, _, last_end = units[-1][0][-1]
+            if not _ends_sentence(pages_by_seq[last_seq].get("text", ""), last_end):
+                pending = units.pop()
+
+        for unit in units:
+            chunk = add(unit)
+            if chunk:
+                yield chunk
+
+        if not span_pages:
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+        # Only pages still referenced by the buffer (or the held-back sentence) are kept
+        live = [unit[0][0][0] for unit in buffer[:1]] + ([pending[0][0][0]] if pending else [])
+        oldest = min(live, default=seq + 1)
+        for old in [k for k in pages_by_seq if k < oldest]:
+            del pages_by_seq[old]
+
+    for chunk in (add(pending) if pending is not None else None, flush()):
+        if chunk:
+            yield chunk
+
+def iter_pages(json_file: str):
+    """
+    Yield page records from a JSON, NDJSON or page pack extraction file.
+    NDJSON files are read line by line and packs one record at a time.
+    """
+    if not isinstance(json_file, str):
+        raise ValueError("Expected JSON file path as str")
+
+    if json_file.endswith(".ndjson"):
+        yield from iter_ndjson(json_file)
+        return
+
+    if json_file.endswith(".pack"):
+        yield from iter_pack(json_file)
+        return
+
+    with open(json_file, "rb") as f:
+        yield from orjson.loads(f.read())
+
+def chunk_text_from_json(json_file: str, max_words: int = 450, overlap: int = 0, span_pages: bool = False):
     """
     Reads JSON file (from PDF or DOCX extraction),
     splits text into chunks, collects images.
-    Returns dict: {"chunks": [...], "images": [...]}
+    Returns dict: {"chunks": [...], "images": [...]}, with each image record
+    listed once and chunks referring to images by id.
     """
-    if isinstance(json_file, str):
-        with open(json_file, "rb") as f:
-            pages = orjson.loads(f.read())
-    else:
+    if not isinstance(json_file, str):
         raise ValueError("Expected JSON file path as str")
 
-    chunk_list = []
     image_list = []
+    seen = set()
 
-    for page in pages:
-        text = page.get("text", "")
-        words = text.split()
-        chunk_index = 1
-
-        # Split text into chunks
-        for i in range(0, len(words), max_words):
-            chunk_text = " ".join(words[i:i + max_words])
-            chunk_id = f"{page.get('page', 0)}_{chunk_index}"
-
-            chunk_list.append({
-                "id": chunk_id,
-                "page": page.get("page", 0),
-                "chunk": chunk_text,
-                "images": page.get("images", [])  # include images per chunk
-            })
-            chunk_index += 1
-
-        # Collect all images
-        for img in page.get("images", []):
-            image_list.append(img)
+    def collect_images(pages):
+        # Collect all images, once per id, as the pages stream past the chunker
+        for page in pages:
+            for img in page.get("images", []):
+                if image_id(img) not in seen:
+                    seen.add(image_id(img))
+                    image_list.append(img)
+            yield page
 
+    chunk_list = list(iter_chunks(collect_images(iter_pages(json_file)), max_words, overlap, span_pages))
     return {"chunks": chunk_list, "images": image_list}
@@ -0,0 +1,96 @@
+import os
+from app.services.chunk_service import chunk_text_from_json, iter_chunks, iter_pages
+from app.services.docx_service import extract_docx_content, extract_docx_content_stream, iter_docx_pages_from_bytes
+from app.services.image_service import make_image_record, memory_image_recorder, public_image_record
+from app.services.pdf_service import extract_pdf_content, extract_pdf_content_stream, iter_pdf_pages_from_bytes
+from app.utils.file_utils import save_bytes
+from app.utils.json_utils import save_pack
+from app.utils.metrics import timed
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+
+def process_document(file_path: str, file_name: str, file_ext: str, max_words: int = 450, stream: bool = False,
+                     overlap: int = 0, span_pages: bool = False) -> dict:
+    """
+    Extract and chunk a saved upload. Blocking; run it off the event loop.
+    Returns the upload response data (chunks + images, or counts when streaming).
+    """
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError("Unsupported file type")
+
+    if stream:
+        with timed("extract"):
+            if file_ext == ".pdf":
+                output_path = extract_pdf_content_stream(file_path)
+            else:
+                output_path = extract_docx_content_stream(file_path)
+
+        image_count = 0
+
+        def count_images(pages):
+            nonlocal image_count
+            for page in pages:
+                image_count += len(page.get("images", []))
+                yield page
+
+        # Offsets only: counting chunks never needs their text
+        with timed("chunk"):
+            chunks = iter_chunks(count_images(iter_pages(output_path)), max_words, overlap, span_pages, include_text=False)
+            chunk_count = sum(1 for _ in chunks)
+
+        return {
+            "file_name": file_name,
+            "file_extension": file_ext,
+            "output_file": os.path.basename(output_path),
+            "chunk_count": chunk_count,
+            "image_count": image_count
+        }
+
+    # Extract content
+    with timed("extract"):
+        if file_ext == ".pdf":
+            output_json_path = extract_pdf_content(file_path)
+        else:
+            output_json_path = extract_docx_content(file_path)
+
+    # Chunk text
+    with timed("chunk"):
+        chunks = chunk_text_from_json(output_json_path, max_words=max_words, overlap=overlap, span_pages=span_pages)
+
+    return {
+        "file_name": file_name,
+        "file_extension": file_ext,
+        "chunks": chunks["chunks"],
+        "images": chunks["images"]
+    }
+
+def extract_document_bytes(data: bytes, file_name: str, file_ext: str, persist: bool = False) -> tuple[list[dict], str | None]:
+    """
+    Extract an upload held in memory, without touching disk unless persist is set.
+    Returns (pages, output file name or None). Image records keep their bytes
+    under "data" so they can be inspected straight from memory.
+    With persist, the upload, its images and a page pack are written as
+    /document/upload would, and image records carry their stored path too.
+    """
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError("Unsupported file type")
+
+    if persist:
+        file_name = os.path.basename(save_bytes(data, file_name))
+
+        def make_record(image_bytes: bytes, filename: str, ext: str = "png") -> dict:
+            return {**make_image_record(image_bytes, filename, ext), "data": image_bytes}
+    else:
+        make_record = memory_image_recorder(file_name)
+
+    base_name = os.path.splitext(file_name)[0]
+    if file_ext == ".pdf":
+        pages = list(iter_pdf_pages_from_bytes(data, base_name, make_record))
+    else:
+        pages = list(iter_docx_pages_from_bytes(data, base_name, make_record))
+
+    if not persist:
+        return pages, None
+
+    stored = ({**page, "images": [public_image_record(img) for img in page["images"]]} for page in pages)
+    return pages, os.path.basename(save_pack(stored, f"{base_name}.pack"))
@@ -1,53 +1,178 @@
+import io
 import os
-from docx import Document
+import zipfile
+import posixpath
 from app.services.image_service import make_image_record
-from app.utils.json_utils import save_json
+from app.utils.json_utils import save_ndjson, save_pack
+from app.utils.lazy_import import lazy_module
+
+etree = lazy_module("lxml.etree")
 
 OUTPUT_DIR = "output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def extract_docx_content(file_path: str) -> str:
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+W_BODY = f"{{{W_NS}}}body"
+W_P = f"{{{W_NS}}}p"
+W_R = f"{{{W_NS}}}r"
+W_HYPERLINK = f"{{{W_NS}}}hyperlink"
+W_T = f"{{{W_NS}}}t"
+W_TAB = f"{{{W_NS}}}tab"
+W_PTAB = f"{{{W_NS}}}ptab"
+W_BR = f"{{{W_NS}}}br"
+W_CR = f"{{{W_NS}}}cr"
+W_NO_BREAK_HYPHEN = f"{{{W_NS}}}noBreakHyphen"
+W_TYPE = f"{{{W_NS}}}type"
+A_BLIP = f"{{{A_NS}}}blip"
+R_EMBED = f"{{{R_NS}}}embed"
+
+def _resolve_target(source_part: str, target: str) -> str:
+    # Relationship targets are relative to the source part's folder (or absolute from the package root)
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+def _relationships(zf: zipfile.ZipFile, part_name: str) -> dict:
+    """
+    {rId: part name} for the internal relationships of a package part.
+    """
+    folder, name = posixpath.split(part_name)
+    rels_name = posixpath.join(folder, "_rels", f"{name}.rels")
+    if rels_name not in zf.NameToInfo:
+        return {}
+
+    rels = {}
+    for rel in etree.fromstring(zf.read(rels_name)).iter(f"{{{PKG_REL_NS}}}Relationship"):
+        if rel.get("TargetMode") != "External":
+            rels[rel.get("Id")] = _resolve_target(part_name, rel.get("Target"))
+    return rels
+
+def _main_document_part(zf: zipfile.ZipFile) -> str:
+    if "_rels/.rels" not in zf.NameToInfo:
+        raise ValueError("File is not a DOCX")
+
+    root = etree.fromstring(zf.read("_rels/.rels"))
+    for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship"):
+        if rel.get("Type", "").endswith("/officeDocument"):
+            return rel.get("Target").lstrip("/")
+    raise ValueError("File is not a DOCX")
+
+def _run_text(run) -> str:
+    # Same mapping as python-docx's Run.text
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == W_T:
+            parts.append(child.text or "")
+        elif tag == W_TAB or tag == W_PTAB:
+            parts.append("\t")
+        elif tag == W_BR:
+            parts.append("\n" if child.get(W_TYPE, "textWrapping") == "textWrapping" else "")
+        elif tag == W_CR:
+            parts.append("\n")
+        elif tag == W_NO_BREAK_HYPHEN:
+            parts.append("-")
+    return "".join(parts)
+
+def _paragraph_text(para) -> str:
+    # Runs directly in the paragraph plus the runs of its hyperlinks, like Paragraph.text
+    parts = []
+    for child in para:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(run) for run in child if run.tag == W_R)
+    return "".join(parts)
+
+def iter_docx_pages(file_path: str):
     """
-    Extract text + images from DOCX and save JSON. Returns JSON path.
+    Yield one {"page", "text", "images"} record per DOCX page (split on page breaks).
+    word/document.xml is parsed once with iterparse; each top-level paragraph is
+    handled when it closes and then discarded, so memory stays flat on long documents.
     """
     if not file_path.endswith(".docx"):
         raise ValueError("File is not a DOCX")
 
     filename = os.path.splitext(os.path.basename(file_path))[0]
-    doc = Document(file_path)
-    pages_data = []
+    return _iter_package_pages(file_path, filename, make_image_record)
+
+def iter_docx_pages_from_bytes(data: bytes, filename: str, make_record=make_image_record):
+    """
+    iter_docx_pages for a DOCX held in memory (e.g. an upload that was never saved).
+    make_record builds each image record; pass image_service.memory_image_recorder
+    to keep images in memory as well.
+    """
+    return _iter_package_pages(io.BytesIO(data), filename, make_record)
+
+def _iter_package_pages(source, filename: str, make_record):
     current_page = {"page": 1, "text": [], "images": []}
     page_number = 1
 
-    for para in doc.paragraphs:
-        if para.runs:
-            for run in para.runs:
-                for br in run._element.findall(".//w:br", run._element.nsmap):
-                    if br.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}type") == "page":
-                        pages_data.append({
-                            "page": page_number,
-                            "text": "\n".join(current_page["text"]).strip(),
-                            "images": current_page["images"]
-                        })
-                        page_number += 1
-                        current_page = {"page": page_number, "text": [], "images": []}
-
-        if para.text.strip():
-            current_page["text"].append(para.text.strip())
-
-        for run in para.runs:
-            if run._element.xpath(".//a:blip"):
-                for blip in run._element.xpath(".//a:blip"):
-                    rId = blip.get("{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed")
-                    image_part = doc.part.related_parts[rId]
-                    image_bytes = image_part.blob
-                    current_page["images"].append(make_image_record(image_bytes, filename=filename, ext="png"))
+    with zipfile.ZipFile(source) as zf:
+        document_part = _main_document_part(zf)
+        related_parts = _relationships(zf, document_part)
+
+        with zf.open(document_part) as xml:
+            for _, para in etree.iterparse(xml, events=("end",), tag=W_P, huge_tree=True):
+                body = para.getparent()
+                # Only body-level paragraphs, as Document.paragraphs (not table cells or text boxes)
+                if body is None or body.tag != W_BODY:
+                    continue
+
+                runs = [child for child in para if child.tag == W_R]
+
+                for run in runs:
+                    for br in run.iter(W_BR):
+                        if br.get(W_TYPE) == "page":
+                            yield {
+                                "page": page_number,
+                                "text": "\n".join(current_page["text"]).strip(),
+                                "images": current_page["images"]
+                            }
+                            page_number += 1
+                            current_page = {"page": page_number, "text": [], "images": []}
+
+                text = _paragraph_text(para).strip()
+                if text:
+                    current_page["text"].append(text)
+
+                for run in runs:
+                    for blip in run.iter(A_BLIP):
+                        part_name = related_parts.get(blip.get(R_EMBED))
+                        if part_name is None:
+                            # Linked (not embedded) image: nothing in the package to extract
+                            continue
+                        image_bytes = zf.read(part_name)
+                        current_page["images"].append(make_record(image_bytes, filename=filename, ext="png"))
+
+                # Done with this paragraph and everything before it
+                para.clear()
+                while para.getprevious() is not None:
+                    del body[0]
 
     if current_page["text"] or current_page["images"]:
-        pages_data.append({
+        yield {
             "page": page_number,
             "text": "\n".join(current_page["text"]).strip(),
             "images": current_page["images"]
-        })
+        }
 
-    return save_json(pages_data, f"{filename}.json")
+def extract_docx_content(file_path: str) -> str:
+    """
+    Extract text + images from DOCX into a page pack. Returns the pack path.
+    Pages are written as they are extracted and can later be read back one at
+    a time (see json_utils.PageReader).
+    """
+    filename = os.path.splitext(os.path.basename(file_path))[0]
+    return save_pack(iter_docx_pages(file_path), f"{filename}.pack")
+
+def extract_docx_content_stream(file_path: str) -> str:
+    """
+    Extract text + images from DOCX page by page into NDJSON. Returns NDJSON path.
+    """
+    filename = os.path.splitext(os.path.basename(file_path))[0]
+    return save_ndjson(iter_docx_pages(file_path), f"{filename}.ndjson")
@@ -1,43 +1,247 @@
 import os
-from PIL import Image
+import time
+import shutil
+import hashlib
+import itertools
+import sqlite3
+import threading
 from io import BytesIO
+from app.utils.lazy_import import lazy_module
+from app.utils.metrics import increment, timed
+from app.utils.output_index import strip_duplicate_suffix
+from app.utils.pagination import PREFIX_END
+
+Image = lazy_module("PIL.Image")
 
 IMAGE_DIR = "images"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+IMAGE_FIELDS = ("name", "base", "hash", "size", "created")
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
-def _get_next_image_number(base_name: str, ext: str) -> int:
-    existing = [
-        f for f in os.listdir(IMAGE_DIR)
-        if f.lower().startswith(f"{base_name.lower()}_image_")
-        and f.lower().endswith(f".{ext.lower()}")
-    ]
-    numbers = []
-    for f in existing:
-        try:
-            num = int(f.split("_")[-1].split(".")[0])
-            numbers.append(num)
-        except ValueError:
-            continue
-    return max(numbers, default=0) + 1
+# Content-addressed blobs live once under images/.store/<sha256>.<ext>; the
+# per-document names (<base>_image_<n>.<ext>) are hard links to them. The
+# index is kept out of images/, which /images/file/ serves.
+STORE_DIR = os.path.join(IMAGE_DIR, ".store")
+INDEX_DIR = "cache"
+INDEX_PATH = os.getenv("IMAGE_INDEX_PATH", os.path.join(INDEX_DIR, "images.sqlite3"))
+LEGACY_INDEX_PATH = os.path.join(IMAGE_DIR, "index.sqlite3")
+os.makedirs(STORE_DIR, exist_ok=True)
 
-def save_image(image_bytes: bytes, filename: str, ext: str = "png") -> str:
+_index_lock = threading.Lock()
+_sync_lock = threading.Lock()
+_index_conn = None
+_index_synced = False
+
+def _index() -> sqlite3.Connection:
+    global _index_conn
+    if _index_conn is None:
+        os.makedirs(os.path.dirname(INDEX_PATH) or ".", exist_ok=True)
+        if not os.path.exists(INDEX_PATH):
+            # Indexes from before the move lived in images/
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.replace(LEGACY_INDEX_PATH + suffix, INDEX_PATH + suffix)
+                except FileNotFoundError:
+                    pass
+        conn = sqlite3.connect(INDEX_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (base TEXT NOT NULL, ext TEXT NOT NULL, last INTEGER NOT NULL, PRIMARY KEY (base, ext))")
+        conn.execute("CREATE TABLE IF NOT EXISTS images (name TEXT PRIMARY KEY, base TEXT NOT NULL, digest TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS images_base ON images (base)")
+        # Listing metadata, added after the first version of the index
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+        for column in ("size INTEGER", "created REAL", "document TEXT"):
+            if column.split()[0] not in columns:
+                conn.execute(f"ALTER TABLE images ADD COLUMN {column}")
+        if "document" not in columns:
+            # Owner filters match the document, which a re-upload's images share
+            conn.executemany("UPDATE images SET document = ? WHERE base = ?",
+                             [(strip_duplicate_suffix(base), base) for (base,) in conn.execute("SELECT DISTINCT base FROM images")])
+        _index_conn = conn
+    return _index_conn
+
+def _next_image_number(conn: sqlite3.Connection, base_name: str, ext: str) -> int:
+    # Numbers are per (base, ext), as with the old directory scan
+    key = (base_name.lower(), ext.lower())
+    conn.execute("INSERT OR IGNORE INTO counters (base, ext, last) VALUES (?, ?, 0)", key)
+    conn.execute("UPDATE counters SET last = last + 1 WHERE base = ? AND ext = ?", key)
+    return conn.execute("SELECT last FROM counters WHERE base = ? AND ext = ?", key).fetchone()[0]
+
+def _store_blob(conn: sqlite3.Connection, image_bytes: bytes, digest: str, ext: str) -> tuple[str, bool]:
+    """Path of the blob for these bytes and whether it was already stored."""
+    row = conn.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()
+    if row and os.path.exists(row[0]):
+        return row[0], True
+
+    # Validate image before it enters the store
+    Image.open(BytesIO(image_bytes)).verify()
+
+    blob_path = os.path.join(STORE_DIR, f"{digest}.{ext}")
+    tmp_path = f"{blob_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(image_bytes)
+    os.replace(tmp_path, blob_path)
+
+    conn.execute("INSERT OR REPLACE INTO blobs (digest, path, size) VALUES (?, ?, ?)",
+                 (digest, blob_path, len(image_bytes)))
+    return blob_path, False
+
+def _link(blob_path: str, img_path: str) -> None:
+    try:
+        os.link(blob_path, img_path)
+    except OSError:
+        # Filesystem without hard links (or link limit reached): fall back to a copy
+        shutil.copyfile(blob_path, img_path)
+
+def save_image_with_digest(image_bytes: bytes, filename: str, ext: str = "png") -> tuple[str, str]:
+    """
+    Store image bytes once by SHA-256 and give them the next per-document name.
+    Returns (path, digest).
+    """
     base_name, _ = os.path.splitext(filename)
     base_name = os.path.basename(base_name)
-    img_num = _get_next_image_number(base_name, ext)
-    img_name = f"{base_name}_image_{img_num}.{ext}"
-    img_path = os.path.join(IMAGE_DIR, img_name)
+    digest = hashlib.sha256(image_bytes).hexdigest()
 
-    with open(img_path, "wb") as f:
-        f.write(image_bytes)
+    with timed("image_save"), _index_lock:
+        conn = _index()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            blob_path, reused = _store_blob(conn, image_bytes, digest, ext)
+            while True:
+                img_num = _next_image_number(conn, base_name, ext)
+                img_name = f"{base_name}_image_{img_num}.{ext}"
+                img_path = os.path.join(IMAGE_DIR, img_name)
+                # Skip names left over from before the index existed
+                if not os.path.exists(img_path):
+                    break
+            _link(blob_path, img_path)
+            conn.execute("INSERT OR REPLACE INTO images (name, base, document, digest, size, created) VALUES (?, ?, ?, ?, ?, ?)",
+                         (img_name, base_name, strip_duplicate_suffix(base_name), digest, len(image_bytes), time.time()))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
 
-    # Validate image
-    Image.open(BytesIO(image_bytes)).verify()
+    increment("images_saved")
+    if reused:
+        increment("images_deduplicated")
+    return img_path, digest
 
-    return img_path
+def save_image(image_bytes: bytes, filename: str, ext: str = "png") -> str:
+    return save_image_with_digest(image_bytes, filename, ext)[0]
 
 def make_image_record(image_bytes: bytes, filename: str, ext: str = "png") -> dict:
-    img_path = save_image(image_bytes, filename, ext)
+    img_path, digest = save_image_with_digest(image_bytes, filename, ext)
     return {
         "id": os.path.splitext(os.path.basename(img_path))[0],
-        "path": img_path
+        "path": img_path,
+        "hash": digest
     }
+
+def memory_image_recorder(filename: str):
+    """
+    make_image_record counterpart for in-memory processing. The returned function
+    builds records that keep the image bytes under "data" instead of a stored
+    path; ids follow the usual <base>_image_<n> pattern, numbered per document
+    in one sequence for all formats so they stay unique without an extension.
+    """
+    base_name = os.path.basename(os.path.splitext(filename)[0])
+    numbers = itertools.count(1)
+
+    def make_record(image_bytes: bytes, filename: str = filename, ext: str = "png") -> dict:
+        return {
+            "id": f"{base_name}_image_{next(numbers)}",
+            "hash": hashlib.sha256(image_bytes).hexdigest(),
+            "ext": ext,
+            "data": image_bytes
+        }
+
+    return make_record
+
+def public_image_record(record) -> dict:
+    """An image record without its in-memory bytes, safe to serialize."""
+    if isinstance(record, dict) and "data" in record:
+        return {k: v for k, v in record.items() if k != "data"}
+    return record
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def sync_image_index() -> None:
+    """
+    Index images saved before the index existed (or copied in by hand) and drop
+    entries whose file is gone. Runs once per process; images are hashed
+    without holding the index lock, so saves carry on during the scan.
+    """
+    global _index_synced
+    if _index_synced:
+        return
+    with _sync_lock:
+        if _index_synced:
+            return
+        # Index first, directory second: an image another process saves in
+        # between is then on disk here, never an indexed row that looks orphaned
+        with _index_lock:
+            indexed = {name for (name,) in _index().execute("SELECT name FROM images")}
+        on_disk = {f for f in os.listdir(IMAGE_DIR) if f.lower().endswith(IMAGE_EXTENSIONS)}
+        gone = [n for n in indexed - on_disk if not os.path.exists(os.path.join(IMAGE_DIR, n))]
+
+        rows = []
+        for name in on_disk - indexed:
+            path = os.path.join(IMAGE_DIR, name)
+            try:
+                stat = os.stat(path)
+                digest = _file_sha256(path)
+            except FileNotFoundError:
+                continue
+            base = name.rsplit("_image_", 1)[0] if "_image_" in name else os.path.splitext(name)[0]
+            rows.append((name, base, strip_duplicate_suffix(base), digest, stat.st_size, stat.st_mtime))
+
+        with _index_lock:
+            conn = _index()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("DELETE FROM images WHERE name = ?", [(n,) for n in gone])
+                # A save during the scan has indexed its image already; keep that row
+                conn.executemany("INSERT OR IGNORE INTO images (name, base, document, digest, size, created) VALUES (?, ?, ?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        _index_synced = True
+
+def list_images(base: str | None = None, prefix: str | None = None, owner: str | None = None,
+                after: str | None = None, limit: int = 50) -> list[dict]:
+    """
+    One page of image metadata from the index in name order, starting after the
+    name `after`. `base` matches the file the images came from exactly;
+    `owner` is a LIKE pattern over its document name, without any
+    "_duplicate_N" suffix (see pagination.owner_pattern).
+    """
+    clauses, params = [], []
+    if base:
+        clauses.append("base = ?")
+        params.append(base)
+    if prefix:
+        clauses.append("name >= ? AND name < ?")
+        params += [prefix, prefix + PREFIX_END]
+    if owner:
+        clauses.append("document LIKE ? ESCAPE '\\'")
+        params.append(owner)
+    if after is not None:
+        clauses.append("name > ?")
+        params.append(after)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with _index_lock:
+        rows = _index().execute(
+            f"SELECT name, base, digest, size, created FROM images {where} ORDER BY name LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+
+    return [dict(zip(IMAGE_FIELDS, row)) for row in rows]
@@ -0,0 +1,139 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+
+# Background upload processing: a fixed worker pool behind a bounded queue.
+# Jobs run in the server process that accepted them, but their status and
+# result live in SQLite, so a poll answered by another gunicorn worker sees
+# them too.
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "16"))
+JOB_RETENTION = int(os.getenv("UPLOAD_JOB_RETENTION", "1000"))
+JOBS_DIR = "cache"
+JOBS_PATH = os.getenv("UPLOAD_JOBS_PATH", os.path.join(JOBS_DIR, "jobs.sqlite3"))
+
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload-job")
+_slots = threading.BoundedSemaphore(UPLOAD_WORKERS + UPLOAD_QUEUE_SIZE)
+_pending = 0  # queued or running in this process
+_lock = threading.Lock()
+_conn = None
+
+_STATUS_COLUMNS = ("job_id", "status", "created_at", "started_at", "finished_at", "error")
+
+
+class QueueFullError(Exception):
+    """Raised when every worker is busy and the queue is at capacity."""
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(JOBS_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(JOBS_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                error TEXT,
+                result BLOB
+            )
+        """)
+        _conn = conn
+    return _conn
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+
+
+def _update(job_id: str, **columns) -> None:
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    with _lock:
+        _db().execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", [*columns.values(), job_id])
+
+
+def _evict_finished(conn: sqlite3.Connection) -> None:
+    # Oldest finished jobs go first; queued/running jobs are never dropped
+    conn.execute("""
+        DELETE FROM jobs WHERE rowid IN (
+            SELECT rowid FROM jobs WHERE status IN ('done', 'failed') ORDER BY rowid
+            LIMIT max(0, (SELECT COUNT(*) FROM jobs) - ?)
+        )
+    """, (JOB_RETENTION,))
+
+
+def _run(job_id: str, fn, args, kwargs) -> None:
+    global _pending
+    try:
+        _update(job_id, status="running", started_at=_now())
+        try:
+            update = {"status": "done", "result": orjson.dumps(fn(*args, **kwargs))}
+        except Exception as e:
+            update = {"status": "failed", "error": str(e)}
+        _update(job_id, finished_at=_now(), **update)
+    finally:
+        with _lock:
+            _pending -= 1
+        _slots.release()
+
+
+def submit_job(fn, *args, **kwargs) -> str:
+    """
+    Queue fn(*args, **kwargs) on the worker pool. Returns the job id.
+    Raises QueueFullError instead of queueing without bound.
+    """
+    global _pending
+    if not _slots.acquire(blocking=False):
+        raise QueueFullError("Upload queue is full, retry later")
+
+    job_id = uuid.uuid4().hex
+    with _lock:
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT INTO jobs (job_id, status, created_at) VALUES (?, 'queued', ?)", (job_id, _now()))
+            _evict_finished(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            _slots.release()
+            raise
+        _pending += 1
+
+    try:
+        _executor.submit(_run, job_id, fn, args, kwargs)
+    except Exception:
+        _slots.release()
+        with _lock:
+            _pending -= 1
+            _db().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        raise
+    return job_id
+
+
+def has_capacity() -> bool:
+    """Cheap pre-check so callers can refuse work before saving an upload."""
+    with _lock:
+        return _pending < UPLOAD_WORKERS + UPLOAD_QUEUE_SIZE
+
+
+def get_job(job_id: str) -> dict | None:
+    """Job status without its result payload, or None if unknown."""
+    with _lock:
+        row = _db().execute(f"SELECT {', '.join(_STATUS_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return None if row is None else dict(zip(_STATUS_COLUMNS, row))
+
+
+def get_job_result(job_id: str):
+    with _lock:
+        row = _db().execute("SELECT result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return None if row is None or row[0] is None else orjson.loads(row[0])
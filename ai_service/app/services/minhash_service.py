@@ -0,0 +1,197 @@
+import os
+import re
+import zlib
+import sqlite3
+import hashlib
+import threading
+from app.utils.lazy_import import lazy_module
+
+np = lazy_module("numpy")
+
+# MinHash signatures of word shingles with an LSH band index, for chunks and
+# documents that are almost, but not exactly, the same text as earlier ones:
+# resubmitted drafts, boilerplate shared between contracts. Entries are keyed
+# by kind ("chunk", "document") and a caller-chosen key, and can be replaced or
+# removed one at a time.
+MINHASH_DIR = "cache"
+MINHASH_PATH = os.getenv("MINHASH_INDEX_PATH", os.path.join(MINHASH_DIR, "minhash.sqlite3"))
+MINHASH_REUSE = os.getenv("MINHASH_REUSE", "1") != "0"
+# Estimated shingle Jaccard similarity at which a chunk reuses an earlier
+# chunk's result, and at which an earlier document is reported as a near-duplicate
+CHUNK_SIMILARITY = float(os.getenv("MINHASH_CHUNK_SIMILARITY", "0.9"))
+DOCUMENT_SIMILARITY = float(os.getenv("MINHASH_DOCUMENT_SIMILARITY", "0.8"))
+
+SHINGLE_WORDS = 5
+MIN_WORDS = 2 * SHINGLE_WORDS  # below this one edit changes most shingles
+NUM_PERM = 128
+# 16 bands of 8 rows: a pair with Jaccard similarity 0.9 shares a band with
+# probability > 0.999, at 0.8 about 0.95, at 0.5 about 0.06
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+HASH_BLOCK = 4096  # shingles hashed per array operation
+
+_MAX_HASH = (1 << 32) - 1
+_SHINGLE_MULTIPLIER = 0x9E3779B97F4A7C15  # odd 64-bit constant for the rolling shingle hash
+_WORD_RE = re.compile(r"\w+")
+
+_lock = threading.Lock()
+_conn = None
+_permutations = None
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(MINHASH_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(MINHASH_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (kind, key)
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                kind TEXT NOT NULL,
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (kind, band, bucket, key)
+            ) WITHOUT ROWID;
+        """)
+        _conn = conn
+    return _conn
+
+
+def _get_permutations():
+    # Multiply-shift hashing, (a * x + b) mod 2**64 >> 32 with odd a: no modulo,
+    # and uint64 arrays wrap around by themselves. Fixed seed: signatures are
+    # persisted, so every process must hash alike.
+    global _permutations
+    if _permutations is None:
+        rng = np.random.RandomState(1)
+        a = rng.randint(0, np.iinfo(np.uint64).max, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+        b = rng.randint(0, np.iinfo(np.uint64).max, size=NUM_PERM, dtype=np.uint64)
+        _permutations = (a, b)
+    return _permutations
+
+
+def _shingle_hashes(text: str):
+    """64-bit hashes of the text's 5-word shingles (empty below MIN_WORDS words)."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return np.empty(0, dtype=np.uint64)
+    # Each word is hashed once; shingles are rolled from the word hashes
+    word_hashes = np.fromiter(map(zlib.crc32, map(str.encode, words)), dtype=np.uint64, count=len(words))
+    count = len(words) - SHINGLE_WORDS + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(SHINGLE_WORDS):
+        hashes = hashes * np.uint64(_SHINGLE_MULTIPLIER) + word_hashes[offset:offset + count]
+    return hashes
+
+
+def minhash(texts, into=None):
+    """
+    MinHash signature (NUM_PERM uint32) of the 5-word shingles of texts, or
+    `into` if none of them has MIN_WORDS words. Signatures of a union are the
+    element-wise minimum, so `into` folds texts into an existing signature.
+    """
+    hashes = np.unique(np.concatenate([_shingle_hashes(text) for text in texts] or [np.empty(0, dtype=np.uint64)]))
+    if not len(hashes):
+        return into
+
+    a, b = _get_permutations()
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(hashes), HASH_BLOCK):
+        block = hashes[start:start + HASH_BLOCK, None]
+        np.minimum(signature, ((block * a + b) >> np.uint64(32)).min(axis=0), out=signature)
+    signature = signature.astype(np.uint32)
+    return signature if into is None else np.minimum(into, signature)
+
+
+def _bands(signature) -> list[int]:
+    rows = signature.reshape(LSH_BANDS, LSH_ROWS)
+    # SQLite integers are signed 64-bit
+    return [int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), "big", signed=True) for band in rows]
+
+
+def _delete(conn: sqlite3.Connection, kind: str, keys: list) -> None:
+    placeholders = ", ".join("?" * len(keys))
+    stored = conn.execute(f"SELECT key, signature FROM signatures WHERE kind = ? AND key IN ({placeholders})", [kind, *keys]).fetchall()
+    conn.executemany("DELETE FROM buckets WHERE kind = ? AND band = ? AND bucket = ? AND key = ?",
+                     [(kind, band, bucket, key) for key, blob in stored
+                      for band, bucket in enumerate(_bands(np.frombuffer(blob, dtype=np.uint32)))])
+    conn.execute(f"DELETE FROM signatures WHERE kind = ? AND key IN ({placeholders})", [kind, *keys])
+
+
+def add_signatures(kind: str, signatures: dict) -> None:
+    """Index {key: minhash()} under kind, replacing earlier signatures of the same keys."""
+    signatures = {key: signature for key, signature in signatures.items() if signature is not None}
+    if not signatures:
+        return
+    with _lock:
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _delete(conn, kind, list(signatures))
+            conn.executemany("INSERT INTO signatures (kind, key, signature) VALUES (?, ?, ?)",
+                             [(kind, key, signature.tobytes()) for key, signature in signatures.items()])
+            conn.executemany("INSERT OR IGNORE INTO buckets (kind, band, bucket, key) VALUES (?, ?, ?, ?)",
+                             [(kind, band, bucket, key) for key, signature in signatures.items()
+                              for band, bucket in enumerate(_bands(signature))])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def remove_signatures(kind: str, keys) -> None:
+    keys = list(keys)
+    if not keys:
+        return
+    with _lock:
+        conn = _db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _delete(conn, kind, keys)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def get_signature(kind: str, key: str):
+    """The indexed signature of key, or None."""
+    with _lock:
+        row = _db().execute("SELECT signature FROM signatures WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+    return np.frombuffer(row[0], dtype=np.uint32) if row else None
+
+
+def find_similar(kind: str, signature, threshold: float) -> list[tuple[float, str]]:
+    """
+    Indexed keys of kind whose estimated Jaccard similarity to signature is at
+    least threshold, as [(similarity, key)] most similar first. Candidates come
+    from the LSH buckets, so pairs well below ~0.7 are rarely even compared.
+    """
+    if signature is None:
+        return []
+    bands = _bands(signature)
+    query = " UNION ".join(["SELECT key FROM buckets WHERE kind = ? AND band = ? AND bucket = ?"] * LSH_BANDS)
+    params = [value for band, bucket in enumerate(bands) for value in (kind, band, bucket)]
+
+    with _lock:
+        conn = _db()
+        keys = [key for (key,) in conn.execute(query, params)]
+        if not keys:
+            return []
+        stored = conn.execute(f"SELECT key, signature FROM signatures WHERE kind = ? AND key IN ({', '.join('?' * len(keys))})",
+                              [kind, *keys]).fetchall()
+
+    matches = []
+    for key, blob in stored:
+        similarity = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == signature))
+        if similarity >= threshold:
+            matches.append((similarity, key))
+    return sorted(matches, key=lambda match: -match[0])
@@ -1,34 +1,138 @@
-import fitz  # PyMuPDF
 import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from app.services.image_service import make_image_record
-from app.utils.json_utils import save_json
+from app.utils.json_utils import save_ndjson, save_pack
+from app.utils.lazy_import import lazy_module
+
+fitz = lazy_module("fitz")  # PyMuPDF
 
 OUTPUT_DIR = "output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def extract_pdf_content(file_path: str) -> str:
+# Worker processes for page extraction; 1 keeps extraction in-process.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "1"))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+# One pool per worker count for the life of the process, started on first use
+_page_pools = {}
+_pools_lock = threading.Lock()
+
+def _read_page(doc, index: int) -> tuple[str, list[tuple[bytes, str]]]:
+    page = doc[index]
+    page_text = page.get_text("text")
+    raw_images = []
+
+    for _, img in enumerate(page.get_images(full=True)):
+        xref = img[0]
+        base_image = doc.extract_image(xref)
+        raw_images.append((base_image["image"], base_image["ext"]))
+
+    return page_text, raw_images
+
+def _read_page_range(file_path: str, start: int, stop: int) -> list:
     """
-    Extract text + images from PDF and save JSON. Returns JSON path.
+    Worker task: open a private document handle and read pages [start, stop).
+    Images are returned as raw bytes so the parent saves them in page order.
+    """
+    with fitz.open(file_path) as doc:
+        return [_read_page(doc, i) for i in range(start, stop)]
+
+def _page_record(index: int, page_text: str, raw_images, filename: str, make_record=make_image_record) -> dict:
+    return {
+        "page": index + 1,
+        "text": page_text.strip(),
+        "images": [make_record(img_bytes, filename=filename, ext=img_ext)
+                   for img_bytes, img_ext in raw_images]
+    }
+
+def _get_page_pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _page_pools.get(workers)
+        if pool is None:
+            # spawn: the server process is multi-threaded, forking it is unsafe
+            pool = _page_pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return pool
+
+def _discard_page_pool(workers: int, pool: ProcessPoolExecutor) -> None:
+    # A worker died: the pool refuses all work from now on, so the next document gets a new one
+    with _pools_lock:
+        if _page_pools.get(workers) is pool:
+            del _page_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _iter_page_ranges(file_path: str, workers: int):
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+
+    starts = deque(range(0, page_count, PAGES_PER_TASK))
+    pool = _get_page_pool(workers)
+    # Keep a bounded window of ranges in flight and yield them in page order
+    pending = deque()
+    try:
+        while starts or pending:
+            while starts and len(pending) < workers * 2:
+                start = starts.popleft()
+                stop = min(start + PAGES_PER_TASK, page_count)
+                pending.append((start, pool.submit(_read_page_range, file_path, start, stop)))
+            start, future = pending.popleft()
+            for offset, page in enumerate(future.result()):
+                yield start + offset, page
+    except BrokenProcessPool:
+        _discard_page_pool(workers, pool)
+        raise
+    finally:
+        # The pool is shared: drop what this document no longer needs
+        for _, future in pending:
+            future.cancel()
+
+def iter_pdf_pages(file_path: str, workers: int | None = None):
+    """
+    Yield one {"page", "text", "images"} record per PDF page.
+    Pages are released as soon as they are consumed. With workers > 1, page
+    ranges are read by a shared process pool (spawned, not forked); image
+    numbering stays in page order.
     """
-    doc = fitz.open(file_path)
-    pages_data = []
     filename = os.path.splitext(os.path.basename(file_path))[0]
+    workers = PDF_WORKERS if workers is None else workers
 
-    for i, page in enumerate(doc):
-        page_text = page.get_text("text")
-        images = []
+    if workers > 1:
+        for index, (page_text, raw_images) in _iter_page_ranges(file_path, workers):
+            yield _page_record(index, page_text, raw_images, filename)
+        return
 
-        for _, img in enumerate(page.get_images(full=True)):
-            xref = img[0]
-            base_image = doc.extract_image(xref)
-            img_bytes = base_image["image"]
-            img_ext = base_image["ext"]
-            images.append(make_image_record(img_bytes, filename=filename, ext=img_ext))
+    with fitz.open(file_path) as doc:
+        for i in range(doc.page_count):
+            page_text, raw_images = _read_page(doc, i)
+            yield _page_record(i, page_text, raw_images, filename)
 
-        pages_data.append({
-            "page": i + 1,
-            "text": page_text.strip(),
-            "images": images
-        })
+def iter_pdf_pages_from_bytes(data: bytes, filename: str, make_record=make_image_record):
+    """
+    iter_pdf_pages for a PDF held in memory (e.g. an upload that was never saved).
+    make_record builds each image record; pass image_service.memory_image_recorder
+    to keep images in memory as well. Pages are read in-process.
+    """
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for i in range(doc.page_count):
+            page_text, raw_images = _read_page(doc, i)
+            yield _page_record(i, page_text, raw_images, filename, make_record)
 
-    return save_json(pages_data, f"{filename}.json")
+def extract_pdf_content(file_path: str, workers: int | None = None) -> str:
+    """
+    Extract text + images from PDF into a page pack. Returns the pack path.
+    Pages are written as they are extracted and can later be read back one at
+    a time (see json_utils.PageReader).
+    """
+    filename = os.path.splitext(os.path.basename(file_path))[0]
+    return save_pack(iter_pdf_pages(file_path, workers=workers), f"{filename}.pack")
+
+def extract_pdf_content_stream(file_path: str, workers: int | None = None) -> str:
+    """
+    Extract text + images from PDF page by page into NDJSON. Returns NDJSON path.
+    Memory stays flat regardless of page count.
+    """
+    filename = os.path.splitext(os.path.basename(file_path))[0]
+    return save_ndjson(iter_pdf_pages(file_path, workers=workers), f"{filename}.ndjson")
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+from itertools import combinations
+
+# Perceptual-hash index of analyzed images: 64-bit dHashes mapped to the
+# SHA-256 of the image they came from. Re-encoded copies of a picture (the same
+# stock photo or logo in another document) hash within a few bits of each
+# other, so their pixel statistics can be reused instead of recomputed.
+INDEX_DIR = "cache"
+INDEX_PATH = os.getenv("PHASH_INDEX_PATH", os.path.join(INDEX_DIR, "phash.sqlite3"))
+LEGACY_INDEX_PATH = os.path.join("images", "phash.sqlite3")
+
+PHASH_REUSE = os.getenv("PHASH_REUSE", "1") != "0"
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "4"))
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+# Multi-index hashing: each band of the hash is indexed on its own. Two hashes
+# within distance r differ in at most r // len(BANDS) bits in some band
+# (pigeonhole), so probing every band with all values that close finds every
+# match. ~21-bit bands keep each probe to about one row per million hashes.
+BANDS = ((43, 21), (22, 21), (0, 22))  # (shift, bits)
+
+_index_lock = threading.Lock()
+_index_conn = None
+
+
+def _index() -> sqlite3.Connection:
+    global _index_conn
+    if _index_conn is None:
+        os.makedirs(os.path.dirname(INDEX_PATH) or ".", exist_ok=True)
+        if not os.path.exists(INDEX_PATH):
+            # Indexes from before the move lived in images/, which /images/file/ serves
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.replace(LEGACY_INDEX_PATH + suffix, INDEX_PATH + suffix)
+                except FileNotFoundError:
+                    pass
+        conn = sqlite3.connect(INDEX_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        band_columns = ", ".join(f"band{i} INTEGER NOT NULL" for i in range(len(BANDS)))
+        conn.execute(f"CREATE TABLE IF NOT EXISTS dhash (digest TEXT PRIMARY KEY, hash INTEGER NOT NULL, {band_columns})")
+        for i in range(len(BANDS)):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS dhash_band{i} ON dhash (band{i})")
+        _index_conn = conn
+    return _index_conn
+
+
+def _bands(image_hash: int) -> list[int]:
+    return [(image_hash >> shift) & ((1 << bits) - 1) for shift, bits in BANDS]
+
+
+def _probes(value: int, bits: int, radius: int) -> list[int]:
+    """value and every value within `radius` flipped bits of it."""
+    probes = [value]
+    for flips in range(1, radius + 1):
+        for positions in combinations(range(bits), flips):
+            flipped = value
+            for position in positions:
+                flipped ^= 1 << position
+            probes.append(flipped)
+    return probes
+
+
+def add_image_hashes(hashes: dict) -> None:
+    """Index {image sha256: 64-bit dHash}; a digest already indexed is replaced."""
+    if not hashes:
+        return
+    # SQLite integers are signed 64-bit
+    rows = [(digest, image_hash - (1 << HASH_BITS) if image_hash >> (HASH_BITS - 1) else image_hash, *_bands(image_hash))
+            for digest, image_hash in hashes.items()]
+    placeholders = ", ".join("?" * (2 + len(BANDS)))
+    with _index_lock:
+        conn = _index()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(f"INSERT OR REPLACE INTO dhash VALUES ({placeholders})", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def find_near_images(image_hash: int, max_distance: int = PHASH_MAX_DISTANCE) -> list[tuple[int, str]]:
+    """
+    Indexed images whose dHash is within max_distance bits of image_hash, as
+    [(distance, sha256)] nearest first.
+    """
+    if max_distance < 0:
+        return []
+    radius = max_distance // len(BANDS)
+    queries, params = [], []
+    for i, ((_, bits), value) in enumerate(zip(BANDS, _bands(image_hash))):
+        probes = _probes(value, bits, radius)
+        queries.append(f"SELECT digest, hash FROM dhash WHERE band{i} IN ({', '.join('?' * len(probes))})")
+        params.extend(probes)
+
+    with _index_lock:
+        rows = _index().execute(" UNION ".join(queries), params).fetchall()
+
+    matches = []
+    for digest, stored in rows:
+        distance = ((stored & HASH_MASK) ^ image_hash).bit_count()
+        if distance <= max_distance:
+            matches.append((distance, digest))
+    return sorted(matches)
+
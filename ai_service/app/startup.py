@@ -0,0 +1,60 @@
+"""
+Process start-up hooks for production servers, plus an import-time report:
+
+    python -m app.startup
+
+preload() imports the heavy libraries up front (gunicorn.conf.py runs it in the
+master, so forked workers share the loaded modules). warm_up() runs once in
+every worker before it accepts requests when APP_WARM_UP=1.
+"""
+import os
+import time
+import importlib
+from app.utils import lazy_import
+from app.utils.metrics import timed
+
+WARM_UP = os.getenv("APP_WARM_UP", "0") != "0"
+
+
+def preload() -> dict:
+    """Import every lazily bound library now. Returns {module: seconds}."""
+    return lazy_import.preload()
+
+
+def warm_up() -> float:
+    """
+    First-call work for this process: detector tables, a tiny text and image
+    analysis, the text worker processes and (if configured) the cloud client.
+    Returns the seconds it took.
+    """
+    from app.services.analysis_service import warm_up as warm_up_analysis
+    from app.helpers.cloud_helper import CLOUD_KEY, CLOUD_URL, get_cloud_client
+
+    started = time.perf_counter()
+    with timed("warm_up"):
+        warm_up_analysis()
+        if CLOUD_KEY and CLOUD_URL:
+            get_cloud_client()
+    return time.perf_counter() - started
+
+
+def format_import_times(times: dict) -> str:
+    return ", ".join(f"{name} {1000 * seconds:.0f} ms" for name, seconds in sorted(times.items(), key=lambda kv: -kv[1]))
+
+
+def main():
+    started = time.perf_counter()
+    importlib.import_module("app.main")
+    app_import = time.perf_counter() - started
+
+    library_times = preload()
+    warm_up_time = warm_up()
+
+    rows = [("app.main (lazy)", app_import)] + sorted(library_times.items(), key=lambda kv: -kv[1])
+    rows += [("total import", app_import + sum(library_times.values())), ("warm-up", warm_up_time)]
+    for name, seconds in rows:
+        print(f"{name:<24}{1000 * seconds:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,159 @@
 import os
-from fastapi import UploadFile
+import hashlib
+import threading
+from collections import OrderedDict
+from fastapi import Request, UploadFile
+from starlette.datastructures import UploadFile as FormFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-async def save_file(file: UploadFile, custom_filename: str = None) -> str:
+# Bytes read from the upload and written to disk per step
+UPLOAD_BUFFER_SIZE = int(os.getenv("UPLOAD_BUFFER_SIZE", str(1024 * 1024)))
+
+# Last duplicate suffix handed out per name, so repeat uploads of the same
+# name start probing where the previous one stopped instead of at 1. Only the
+# most recently used names are kept; a forgotten name probes from 1 again.
+DUPLICATE_HINTS_MAX = int(os.getenv("UPLOAD_DUPLICATE_HINTS", "10000"))
+_duplicate_hints = OrderedDict()
+_hints_lock = threading.Lock()
+
+def _create_exclusive(filename: str) -> tuple[int, str]:
     """
-    Save uploaded file to UPLOAD_DIR. Handles duplicate names.
-    If custom_filename is provided, use it instead of file.filename.
-    Returns the full path.
+    Atomically create a new file in UPLOAD_DIR, adding _duplicate_N on collision.
+    Returns (fd, path).
     """
-    filename = custom_filename if custom_filename else file.filename
     name, ext = os.path.splitext(filename)
-    file_path = os.path.join(UPLOAD_DIR, filename)
+    with _hints_lock:
+        i = _duplicate_hints.get(filename, 0)
+
+    while True:
+        candidate = filename if i == 0 else f"{name}_duplicate_{i}{ext}"
+        file_path = os.path.join(UPLOAD_DIR, candidate)
+        try:
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o644)
+        except FileExistsError:
+            i += 1
+            continue
+        with _hints_lock:
+            _duplicate_hints[filename] = max(_duplicate_hints.get(filename, 0), i + 1)
+            _duplicate_hints.move_to_end(filename)
+            while len(_duplicate_hints) > DUPLICATE_HINTS_MAX:
+                _duplicate_hints.popitem(last=False)
+        return fd, file_path
+
+async def save_file_with_digest(file: UploadFile, custom_filename: str = None, buffer_size: int = None) -> tuple[str, str]:
+    """
+    Stream an upload to UPLOAD_DIR in buffer_size pieces, hashing as it goes.
+    Returns (path, sha256 hex digest).
+    """
+    filename = custom_filename if custom_filename else file.filename
+    buffer_size = buffer_size or UPLOAD_BUFFER_SIZE
+    fd, file_path = _create_exclusive(filename)
+    digest = hashlib.sha256()
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await file.read(buffer_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(file_path)
+        raise
+
+    return file_path, digest.hexdigest()
+
+class UploadTooLarge(Exception):
+    """The upload is bigger than the caller's in-memory limit."""
+
+async def read_upload(file: UploadFile, max_bytes: int, buffer_size: int = None) -> tuple[bytes, str]:
+    """
+    Read a whole upload into memory, hashing as it goes.
+    Returns (bytes, sha256 hex digest); raises UploadTooLarge past max_bytes.
+    """
+    buffer_size = buffer_size or UPLOAD_BUFFER_SIZE
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
 
-    i = 1
-    while os.path.exists(file_path):
-        new_filename = f"{name}_duplicate_{i}{ext}"
-        file_path = os.path.join(UPLOAD_DIR, new_filename)
-        i += 1
+    while True:
+        chunk = await file.read(buffer_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+        digest.update(chunk)
+        chunks.append(chunk)
 
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    return b"".join(chunks), digest.hexdigest()
 
+# Room for the multipart boundaries and part headers around an in-memory upload
+MULTIPART_OVERHEAD = 64 * 1024
+
+class _InMemoryMultiPartParser(MultiPartParser):
+    # max_size=0: the SpooledTemporaryFile behind a file part never rolls over to disk
+    spool_max_size = 0
+
+async def read_multipart_upload(request: Request, field: str, max_bytes: int) -> tuple[str, bytes, str]:
+    """
+    Read file `field` of a multipart request into memory without spooling it to
+    disk. A Content-Length over max_bytes (plus MULTIPART_OVERHEAD) is refused
+    before the body is read, and a body without one is cut off as it streams.
+    Returns (filename, bytes, sha256 hex digest). Raises UploadTooLarge, or
+    ValueError for a malformed form or a missing file.
+    """
+    limit = max_bytes + MULTIPART_OVERHEAD
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise ValueError("Expected a multipart/form-data upload")
+
+    async def capped_stream():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+            yield chunk
+
+    try:
+        form = await _InMemoryMultiPartParser(request.headers, capped_stream()).parse()
+    except MultiPartException as e:
+        raise ValueError(str(e))
+    try:
+        upload = form.get(field)
+        if not isinstance(upload, FormFile):
+            raise ValueError(f"Missing file field '{field}'")
+        data, digest = await read_upload(upload, max_bytes)
+        return upload.filename or "", data, digest
+    finally:
+        await form.close()
+
+def save_bytes(data: bytes, filename: str) -> str:
+    """
+    Write an upload already held in memory to UPLOAD_DIR. Handles duplicate names.
+    Returns the full path.
+    """
+    fd, file_path = _create_exclusive(filename)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+    except BaseException:
+        os.remove(file_path)
+        raise
+    return file_path
+
+async def save_file(file: UploadFile, custom_filename: str = None) -> str:
+    """
+    Save uploaded file to UPLOAD_DIR. Handles duplicate names.
+    If custom_filename is provided, use it instead of file.filename.
+    Returns the full path.
+    """
+    file_path, _ = await save_file_with_digest(file, custom_filename)
     return file_path
@@ -1,16 +1,28 @@
 import os
+import sys
+import mmap
+import struct
+from array import array
 import orjson
+from app.utils.output_index import record_output
 
 OUTPUT_DIR = "output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def save_json(data, filename: str) -> str:
-    """
-    Save JSON data into OUTPUT_DIR. Returns full path.
-    """
+# Extraction outputs, in lookup order for names given without an extension
+OUTPUT_EXTENSIONS = (".pack", ".json", ".ndjson")
+
+# Page pack layout: MAGIC, compact JSON records back to back, an index of
+# record start offsets (little-endian uint64, plus one end offset), then the trailer
+# (index offset, record count, MAGIC). Writers never seek back; readers
+# mmap the file and decode only the records they touch.
+PACK_MAGIC = b"PGPACK01"
+_PACK_TRAILER = struct.Struct("<QQ8s")
+
+def _unique_output_path(filename: str, default_ext: str) -> str:
     name, ext = os.path.splitext(filename)
     if not ext:
-        ext = ".json"
+        ext = default_ext
     file_path = os.path.join(OUTPUT_DIR, name + ext)
 
     i = 1
@@ -19,19 +31,170 @@ def save_json(data, filename: str) -> str:
         file_path = os.path.join(OUTPUT_DIR, new_filename)
         i += 1
 
+    return file_path
+
+def _resolve_output_path(path: str) -> str:
+    if os.path.isabs(path) or path.startswith(OUTPUT_DIR + os.sep):
+        return path
+    return os.path.join(OUTPUT_DIR, path)
+
+def save_json(data, filename: str) -> str:
+    """
+    Save JSON data into OUTPUT_DIR. Returns full path.
+    """
+    file_path = _unique_output_path(filename, ".json")
+
     with open(file_path, "wb") as f:
         f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
 
+    record_output(file_path, len(data) if isinstance(data, list) else None)
+    return file_path
+
+def save_ndjson(records, filename: str) -> str:
+    """
+    Write records into OUTPUT_DIR as NDJSON, one line per record, consuming
+    the iterable as it goes so only one record is held at a time. Returns full path.
+    """
+    file_path = _unique_output_path(filename, ".ndjson")
+
+    count = 0
+    with open(file_path, "wb") as f:
+        for record in records:
+            f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+            count += 1
+
+    record_output(file_path, count)
+    return file_path
+
+def iter_ndjson(path: str):
+    """
+    Yield records one at a time from an NDJSON file (full path or name inside OUTPUT_DIR).
+    """
+    with open(_resolve_output_path(path), "rb") as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
+
+def save_pack(records, filename: str) -> str:
+    """
+    Write records into OUTPUT_DIR as a page pack, consuming the iterable as it
+    goes so only one record is held at a time. Returns full path.
+    """
+    file_path = _unique_output_path(filename, ".pack")
+
+    offsets = array("Q")
+    with open(file_path, "wb") as f:
+        f.write(PACK_MAGIC)
+        position = len(PACK_MAGIC)
+        for record in records:
+            payload = orjson.dumps(record)
+            offsets.append(position)
+            f.write(payload)
+            position += len(payload)
+        offsets.append(position)
+
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        f.write(offsets.tobytes())
+        f.write(_PACK_TRAILER.pack(position, len(offsets) - 1, PACK_MAGIC))
+
+    record_output(file_path, len(offsets) - 1)
     return file_path
 
+class PageReader:
+    """
+    Random access to the records of a page pack without parsing the whole file.
+    The file is memory-mapped and records are decoded straight from the map,
+    so reading page 500 of a large document touches only that page's bytes.
+    Use as a context manager, or call close().
+    """
+
+    def __init__(self, path: str):
+        self.path = _resolve_output_path(path)
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._view = memoryview(self._map)
+            if len(self._map) < len(PACK_MAGIC) + _PACK_TRAILER.size:
+                raise ValueError(f"Not a page pack: {self.path}")
+            index_offset, count, magic = _PACK_TRAILER.unpack_from(self._map, len(self._map) - _PACK_TRAILER.size)
+            if self._map[:len(PACK_MAGIC)] != PACK_MAGIC or magic != PACK_MAGIC:
+                raise ValueError(f"Not a page pack: {self.path}")
+            # The index must end exactly where the trailer starts
+            if index_offset + 8 * (count + 1) + _PACK_TRAILER.size != len(self._map):
+                raise ValueError(f"Corrupt page pack index: {self.path}")
+            # The index is small (8 bytes per page); the records stay in the map
+            self._offsets = array("Q", self._map[index_offset:index_offset + 8 * (count + 1)])
+            if sys.byteorder != "little":
+                self._offsets.byteswap()
+            self._count = count
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self) -> int:
+        return self._count
+
+    def raw(self, index: int) -> memoryview:
+        """Encoded bytes of record `index`, as a view into the mapped file."""
+        if not -self._count <= index < self._count:
+            raise IndexError("page index out of range")
+        index %= self._count
+        return self._view[self._offsets[index]:self._offsets[index + 1]]
+
+    def __getitem__(self, index: int):
+        return orjson.loads(self.raw(index))
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def close(self):
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_pack(path: str):
+    """
+    Yield records one at a time from a page pack (full path or name inside OUTPUT_DIR).
+    """
+    with PageReader(path) as reader:
+        yield from reader
+
+def find_output_file(name: str) -> str | None:
+    """
+    Name of the extraction output for `name` inside OUTPUT_DIR, trying each of
+    OUTPUT_EXTENSIONS when no known extension is given. None when missing.
+    """
+    if name.lower().endswith(OUTPUT_EXTENSIONS):
+        candidates = [name]
+    else:
+        candidates = [f"{name}{ext}" for ext in OUTPUT_EXTENSIONS]
+
+    for candidate in candidates:
+        if os.path.exists(os.path.join(OUTPUT_DIR, candidate)):
+            return candidate
+    return None
+
 def load_json(path: str):
     """
     Load JSON from full path or filename inside OUTPUT_DIR.
+    NDJSON files and page packs are returned as a list of records.
     """
-    if os.path.isabs(path) or path.startswith(OUTPUT_DIR + os.sep):
-        file_path = path
-    else:
-        file_path = os.path.join(OUTPUT_DIR, path)
+    file_path = _resolve_output_path(path)
+    if file_path.endswith(".ndjson"):
+        return list(iter_ndjson(file_path))
+    if file_path.endswith(".pack"):
+        return list(iter_pack(file_path))
 
     with open(file_path, "rb") as f:
         return orjson.loads(f.read())
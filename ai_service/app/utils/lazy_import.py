@@ -0,0 +1,70 @@
+import sys
+import time
+import types
+import importlib
+import threading
+from app.utils.metrics import observe
+
+# Heavy libraries (numpy, PyMuPDF, Pillow, lxml, requests) are bound at module
+# level through lazy_module(), so importing the app stays fast and a library
+# is only loaded when a request first needs it. preload() loads them all up
+# front instead, e.g. in a server master before forking workers.
+
+_lock = threading.Lock()
+_registry = {}
+_import_times = {}
+
+
+class LazyModule(types.ModuleType):
+    """
+    Placeholder for a module that is imported on first attribute access.
+    After that the real module's namespace is copied in, so later lookups are
+    plain attribute reads.
+    """
+
+    def __getattr__(self, attr):
+        module = load(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_module(name: str) -> LazyModule:
+    """Module `name` (e.g. "numpy", "PIL.Image"), imported on first use."""
+    with _lock:
+        module = _registry.get(name)
+        if module is None:
+            module = _registry[name] = LazyModule(name)
+        return module
+
+
+def load(name: str) -> types.ModuleType:
+    """Import a module now, recording how long it took if it wasn't loaded yet."""
+    # Always go through import_module: a module another thread is still
+    # importing is already in sys.modules, and import_module waits for it
+    loaded = name in sys.modules
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - started
+    if not loaded:
+        with _lock:
+            first = name not in _import_times
+            if first:
+                _import_times[name] = elapsed
+        if first:
+            observe("import", elapsed)
+    return module
+
+
+def preload() -> dict:
+    """Import every registered lazy module now. Returns import_times()."""
+    with _lock:
+        modules = dict(_registry)
+    for name, lazy in modules.items():
+        lazy.__dict__.update(load(name).__dict__)
+    return import_times()
+
+
+def import_times() -> dict:
+    """{module: seconds} spent on the first import of each lazy module."""
+    with _lock:
+        return dict(_import_times)
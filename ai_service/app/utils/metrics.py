@@ -0,0 +1,233 @@
+import io
+import os
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+# In-process metrics, exposed in Prometheus text format by /metrics.
+# Work done inside worker processes (PDF pages, text batches) is timed by the
+# parent call that waits for it.
+# With several server processes (gunicorn workers) set METRICS_DIR: each
+# process then writes its totals to a file there every METRICS_FLUSH_SECONDS,
+# and /metrics adds up the files of every process, including exited ones, so
+# counters never go backwards. Clear the directory when the server starts.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROFILE_TOP = 25
+
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_process_file = None  # this process's file in METRICS_DIR, once it has recorded something
+
+# Stage totals for the current request, when it asked for ?profile=1
+_request_stages: ContextVar[dict | None] = ContextVar("request_stages", default=None)
+
+COUNTER_HELP = {
+    "images_saved": "Images written to the image store",
+    "images_deduplicated": "Saved images whose content was already in the store",
+    "images_near_duplicate": "Analyzed images whose pixel statistics were reused from a near-duplicate",
+    "chunks_near_duplicate": "Chunks whose text analysis was reused from a near-duplicate chunk",
+    "documents_near_duplicate": "Analyzed documents with at least one near-duplicate document",
+}
+
+
+class _Histogram:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self):
+        self.buckets = [0] * len(STAGE_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect_left(STAGE_BUCKETS, value)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _reset_in_child() -> None:
+    # A forked process starts from zero; its parent reports what it recorded
+    global _lock, _process_file
+    _lock = threading.Lock()
+    _stages.clear()
+    _counters.clear()
+    _process_file = None
+
+
+os.register_at_fork(after_in_child=_reset_in_child)
+
+
+def _snapshot() -> tuple[dict, dict]:
+    with _lock:
+        stages = {name: (list(h.buckets), h.sum, h.count) for name, h in _stages.items()}
+        return stages, dict(_counters)
+
+
+def _write_snapshot() -> None:
+    stages, counters = _snapshot()
+    temp_path = f"{_process_file}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"stages": stages, "counters": counters}, f)
+    os.replace(temp_path, _process_file)
+
+
+def _flush_periodically() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            _write_snapshot()
+        except OSError:
+            pass
+
+
+def _start_flushing() -> None:
+    global _process_file
+    with _lock:
+        if _process_file is not None:
+            return
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        # pids are reused by later workers, whose totals must not replace these
+        _process_file = os.path.join(METRICS_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+    threading.Thread(target=_flush_periodically, name="metrics-flush", daemon=True).start()
+
+
+def _merged_snapshots() -> tuple[dict, dict]:
+    """Totals of every process that wrote to METRICS_DIR."""
+    if _process_file is not None:
+        _write_snapshot()
+    stages, counters = {}, {}
+    for name in os.listdir(METRICS_DIR) if os.path.isdir(METRICS_DIR) else []:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for stage, (buckets, total, count) in snapshot["stages"].items():
+            merged = stages.setdefault(stage, ([0] * len(STAGE_BUCKETS), 0.0, 0))
+            stages[stage] = ([a + b for a, b in zip(merged[0], buckets)], merged[1] + total, merged[2] + count)
+        for counter, value in snapshot["counters"].items():
+            counters[counter] = counters.get(counter, 0) + value
+    return stages, counters
+
+
+def observe(stage: str, seconds: float) -> None:
+    if METRICS_DIR and _process_file is None:
+        _start_flushing()
+    with _lock:
+        histogram = _stages.get(stage)
+        if histogram is None:
+            histogram = _stages[stage] = _Histogram()
+        histogram.observe(seconds)
+
+        per_request = _request_stages.get()
+        if per_request is not None:
+            total, calls = per_request.get(stage, (0.0, 0))
+            per_request[stage] = (total + seconds, calls + 1)
+
+
+def increment(counter: str, amount: int = 1) -> None:
+    if METRICS_DIR and _process_file is None:
+        _start_flushing()
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + amount
+
+
+class timed(ContextDecorator):
+    """
+    Record the duration of a block (`with timed("chunk"):`) or of every call to
+    a function (`@timed("extract")`) in the stage histogram.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._started = threading.local()
+
+    def __enter__(self):
+        starts = getattr(self._started, "stack", None)
+        if starts is None:
+            starts = self._started.stack = []
+        starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self._started.stack.pop())
+        return False
+
+
+def render_prometheus() -> str:
+    """
+    All metrics in Prometheus text exposition format (version 0.0.4), summed
+    over every server process when METRICS_DIR is set.
+    """
+    stages, counters = _merged_snapshots() if METRICS_DIR else _snapshot()
+
+    lines = [
+        "# HELP ai_service_stage_duration_seconds Time spent per pipeline stage",
+        "# TYPE ai_service_stage_duration_seconds histogram",
+    ]
+    for stage in sorted(stages):
+        buckets, total, count = stages[stage]
+        cumulative = 0
+        for bound, hits in zip(STAGE_BUCKETS, buckets):
+            cumulative += hits
+            lines.append(f'ai_service_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'ai_service_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        lines.append(f'ai_service_stage_duration_seconds_sum{{stage="{stage}"}} {total}')
+        lines.append(f'ai_service_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+    for counter in sorted(set(COUNTER_HELP) | set(counters)):
+        name = f"ai_service_{counter}_total"
+        lines.append(f"# HELP {name} {COUNTER_HELP.get(counter, counter)}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {counters.get(counter, 0)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def profile_call(fn, *args, **kwargs):
+    """
+    Run fn under cProfile in the calling thread, with per-stage timings captured.
+    Returns (result, breakdown): the top functions by cumulative time plus the
+    stage totals recorded by `timed` during the call. Stage totals include work
+    handed to pools; the function list only covers the calling thread.
+    """
+    stages = {}
+    token = _request_stages.set(stages)
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        result = profiler.runcall(fn, *args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - started
+        _request_stages.reset(token)
+
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    stats.sort_stats("cumulative")
+    functions = []
+    for (filename, line, name) in stats.fcn_list[:PROFILE_TOP]:
+        primitive, calls, tottime, cumtime, _ = stats.stats[(filename, line, name)]
+        functions.append({
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "tottime_ms": round(1000 * tottime, 3),
+            "cumtime_ms": round(1000 * cumtime, 3)
+        })
+
+    breakdown = {
+        "total_ms": round(1000 * elapsed, 3),
+        "stages": {stage: {"total_ms": round(1000 * total, 3), "calls": calls} for stage, (total, calls) in stages.items()},
+        "functions": functions
+    }
+    return result, breakdown
@@ -0,0 +1,114 @@
+import os
+import re
+import sqlite3
+import threading
+
+from app.utils.pagination import PREFIX_END
+
+# Metadata for extraction outputs in output/, kept up to date by the json_utils
+# writers so listings never have to open or parse the files themselves.
+OUTPUT_DIR = "output"
+INDEX_PATH = os.path.join(OUTPUT_DIR, "index.sqlite3")
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+OUTPUT_FIELDS = ("file_name", "base", "format", "size", "pages", "created")
+
+_DUPLICATE_RE = re.compile(r"_duplicate_\d+$")
+
+_lock = threading.Lock()
+_conn = None
+_synced = False
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(INDEX_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS outputs (
+                name TEXT PRIMARY KEY,
+                base TEXT NOT NULL,
+                format TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                pages INTEGER,
+                created REAL NOT NULL
+            )
+        """)
+        _conn = conn
+    return _conn
+
+def strip_duplicate_suffix(base: str) -> str:
+    """Re-uploads get "_duplicate_N" names but belong to the same document."""
+    return _DUPLICATE_RE.sub("", base)
+
+def document_base(name: str) -> str:
+    """Base name of the document a file belongs to: no directory, extension or "_duplicate_N"."""
+    return strip_duplicate_suffix(os.path.splitext(os.path.basename(name))[0])
+
+def _row(file_path: str, pages: int | None) -> tuple:
+    name = os.path.basename(file_path)
+    ext = os.path.splitext(name)[1]
+    stat = os.stat(file_path)
+    return name, document_base(name), ext.lstrip(".").lower(), stat.st_size, pages, stat.st_mtime
+
+def record_output(file_path: str, pages: int | None = None) -> None:
+    """
+    Add or refresh the index entry for an output file that was just written.
+    """
+    row = _row(file_path, pages)
+    with _lock:
+        _db().execute("INSERT OR REPLACE INTO outputs (name, base, format, size, pages, created) VALUES (?, ?, ?, ?, ?, ?)", row)
+
+def sync_output_index(extensions: tuple[str, ...]) -> None:
+    """
+    Index outputs written before the index existed (or copied in by hand) and
+    drop entries whose file is gone. Runs once per process.
+    """
+    global _synced
+    if _synced:
+        return
+    with _lock:
+        if _synced:
+            return
+        conn = _db()
+        # Index first, directory second: a file another process writes in
+        # between is then on disk here, never an indexed row that looks orphaned
+        indexed = {name for (name,) in conn.execute("SELECT name FROM outputs")}
+        on_disk = {f for f in os.listdir(OUTPUT_DIR) if f.lower().endswith(extensions)}
+        gone = [n for n in indexed - on_disk if not os.path.exists(os.path.join(OUTPUT_DIR, n))]
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM outputs WHERE name = ?", [(n,) for n in gone])
+            conn.executemany("INSERT OR IGNORE INTO outputs (name, base, format, size, pages, created) VALUES (?, ?, ?, ?, ?, ?)",
+                             [_row(os.path.join(OUTPUT_DIR, n), None) for n in on_disk - indexed])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        _synced = True
+
+def list_outputs(prefix: str | None = None, owner: str | None = None, after: str | None = None, limit: int = 50) -> list[dict]:
+    """
+    One page of output metadata in name order, starting after the name `after`.
+    `owner` is a LIKE pattern over the base name (see pagination.owner_pattern).
+    """
+    clauses, params = [], []
+    if prefix:
+        clauses.append("name >= ? AND name < ?")
+        params += [prefix, prefix + PREFIX_END]
+    if owner:
+        clauses.append("base LIKE ? ESCAPE '\\'")
+        params.append(owner)
+    if after is not None:
+        clauses.append("name > ?")
+        params.append(after)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with _lock:
+        rows = _db().execute(
+            f"SELECT name, base, format, size, pages, created FROM outputs {where} ORDER BY name LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+
+    return [dict(zip(OUTPUT_FIELDS, row)) for row in rows]
@@ -0,0 +1,49 @@
+import base64
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Upper bound for a "starts with" range scan: name >= prefix AND name < prefix + PREFIX_END
+PREFIX_END = "\U0010ffff"
+
+def encode_cursor(name: str) -> str:
+    """Opaque cursor pointing just past `name` in name order."""
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str | None) -> str | None:
+    if not cursor:
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: str | None, allowed: tuple[str, ...]) -> tuple[str, ...] | None:
+    """
+    Comma-separated field projection. None when not given; 400 on unknown fields.
+    """
+    if fields is None:
+        return None
+    names = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in names if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    return names
+
+def owner_pattern(userId: str | None, username: str | None) -> str | None:
+    """
+    SQL LIKE pattern (escape '\\') matching base names saved as
+    <file>_<username>_<userId>, or None when no owner filter is given. Match it
+    against names without their "_duplicate_N" re-upload suffix.
+    """
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+    if userId and username:
+        return f"%\\_{escape(username)}\\_{escape(userId)}"
+    if userId:
+        return f"%\\_{escape(userId)}"
+    if username:
+        return f"%\\_{escape(username)}\\_%"
+    return None
@@ -0,0 +1,83 @@
+import io
+import random
+import fitz
+from docx import Document
+from docx.enum.text import WD_BREAK
+from docx.shared import Inches
+from PIL import Image
+
+# Synthetic corpus for the benchmarks: seeded, so every run sees the same inputs.
+
+_VOCABULARY = (
+    "the of and to in is that for it as with was on be by this are or from at an which "
+    "model data system results analysis document report value method process however "
+    "moreover furthermore therefore significant approach performance table figure section "
+    "we our you they i it's don't can't 2021 3.5 12% january"
+).split()
+
+
+def make_sentence(rng: random.Random, min_words: int = 6, max_words: int = 24) -> str:
+    words = [rng.choice(_VOCABULARY) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + rng.choice(".....!?")
+
+
+def make_text(rng: random.Random, words: int) -> str:
+    """Prose of roughly `words` words, in sentences."""
+    sentences, count = [], 0
+    while count < words:
+        sentence = make_sentence(rng)
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+
+def make_image_bytes(rng: random.Random, size: int = 256, fmt: str = "PNG") -> bytes:
+    """Noisy gradient image, distinct per call (so the image store can't dedupe it)."""
+    base = Image.linear_gradient("L").resize((size, size))
+    noise = Image.effect_noise((size, size), rng.uniform(10, 80))
+    image = Image.merge("RGB", (base, noise, base.rotate(rng.randrange(360))))
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def make_pdf(path: str, pages: int, images_per_page: int, words_per_page: int = 400, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    with fitz.open() as doc:
+        for _ in range(pages):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(36, 36, 576, 500), make_text(rng, words_per_page), fontsize=7)
+            for i in range(images_per_page):
+                x = 36 + (i % 4) * 130
+                y = 520 + (i // 4) * 130
+                page.insert_image(fitz.Rect(x, y, x + 120, y + 120), stream=make_image_bytes(rng))
+        doc.save(path)
+    return path
+
+
+def make_docx(path: str, pages: int, images_per_page: int, words_per_page: int = 400, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    doc = Document()
+    for page in range(pages):
+        remaining = words_per_page
+        while remaining > 0:
+            paragraph = make_text(rng, min(remaining, rng.randint(40, 120)))
+            doc.add_paragraph(paragraph)
+            remaining -= len(paragraph.split())
+        for _ in range(images_per_page):
+            doc.add_picture(io.BytesIO(make_image_bytes(rng)), width=Inches(1.5))
+        if page < pages - 1:
+            doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+    doc.save(path)
+    return path
+
+
+def make_chunks(sizes: tuple[int, ...], per_size: int, seed: int = 0) -> dict[int, list[str]]:
+    """{word count: [text chunk, ...]} for text-detector benchmarks."""
+    rng = random.Random(seed)
+    return {size: [make_text(rng, size) for _ in range(per_size)] for size in sizes}
+
+
+def make_images(count: int, size: int = 512, seed: int = 0) -> list[bytes]:
+    rng = random.Random(seed)
+    return [make_image_bytes(rng, size, rng.choice(("PNG", "JPEG"))) for _ in range(count)]
@@ -0,0 +1,319 @@
+"""
+Benchmarks for the extraction, chunking and detection hot paths.
+
+Run from ai_service/:
+
+    python -m benchmarks.run                       # default corpus, results/bench-<time>.json
+    python -m benchmarks.run --pages 50 --images 4 --repeat 5
+    python -m benchmarks.run --stages analyze_text,image_inspector
+    python -m benchmarks.run --compare benchmarks/results/bench-20250101-120000.json
+
+Every stage reports throughput, p50/p95/p99 latency and peak RSS. The service
+writes output/, images/ and cache/ relative to the working directory, so the
+run happens in a scratch directory (--workdir, default a temp dir). The cloud
+detector is replaced by a local stub so results don't depend on the network.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(SERVICE_DIR, "benchmarks", "results")
+
+STAGES = ("startup", "extract_pdf", "extract_docx", "chunk", "analyze_text", "image_inspector", "phash_lookup", "upload_analyze")
+CHUNK_SIZES = (50, 450, 2000)
+
+
+class RssSampler:
+    """
+    Peak resident set size of this process while the block runs, sampled from
+    /proc every few ms. Falls back to the lifetime peak from getrusage where
+    /proc is not available. Worker processes are not included.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def measure(fn, inputs: list, repeat: int = 1, units=None) -> dict:
+    """
+    Call fn(item) for every input, `repeat` times over, and summarize latency.
+    units(item) gives the work units per call (pages, words, ...) for throughput.
+    """
+    latencies = []
+    total_units = 0
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for item in inputs:
+                t = time.perf_counter()
+                fn(item)
+                latencies.append(time.perf_counter() - t)
+                total_units += units(item) if units else 1
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "units": total_units,
+        "seconds": round(elapsed, 4),
+        "throughput_per_s": round(total_units / elapsed, 2) if elapsed else None,
+        "mean_ms": round(1000 * elapsed / len(latencies), 3) if latencies else None,
+        "p50_ms": round(1000 * percentile(latencies, 50), 3),
+        "p95_ms": round(1000 * percentile(latencies, 95), 3),
+        "p99_ms": round(1000 * percentile(latencies, 99), 3),
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1)
+    }
+
+
+class _CloudStub(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"score": 0.42}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_cloud_stub() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CloudStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_stages(args, stages: tuple[str, ...]) -> dict:
+    # Imported here: the app creates its data directories relative to the cwd
+    from benchmarks import corpus
+    from app.services.pdf_service import extract_pdf_content
+    from app.services.docx_service import extract_docx_content
+    from app.services.chunk_service import chunk_text_from_json
+    from app.interceptors.text_interceptor import analyze_text
+    from app.interceptors.Image_interceptor import image_inspector
+
+    os.makedirs("corpus", exist_ok=True)
+    pdfs = [corpus.make_pdf(f"corpus/doc_{i}.pdf", args.pages, args.images, args.words, seed=args.seed + i)
+            for i in range(args.documents)]
+    docxs = [corpus.make_docx(f"corpus/doc_{i}.docx", args.pages, args.images, args.words, seed=args.seed + i)
+             for i in range(args.documents)]
+
+    results = {}
+
+    if "startup" in stages:
+        # Cold import of the app in a fresh interpreter, as a new worker pays it
+        env = dict(os.environ, PYTHONPATH=SERVICE_DIR)
+
+        def cold_start(code):
+            subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True)
+
+        results["startup[import]"] = measure(cold_start, ["import app.main"], args.repeat)
+        results["startup[preload]"] = measure(
+            cold_start, ["import app.main; from app import startup; startup.preload()"], args.repeat)
+
+    if "extract_pdf" in stages:
+        results["extract_pdf"] = measure(extract_pdf_content, pdfs, args.repeat, units=lambda _: args.pages)
+
+    if "extract_docx" in stages:
+        results["extract_docx"] = measure(extract_docx_content, docxs, args.repeat, units=lambda _: args.pages)
+
+    if "chunk" in stages:
+        extracted = [extract_pdf_content(path) for path in pdfs]
+        results["chunk"] = measure(chunk_text_from_json, extracted, args.repeat, units=lambda _: args.pages)
+
+    if "analyze_text" in stages:
+        for size, chunks in corpus.make_chunks(CHUNK_SIZES, args.chunks, seed=args.seed).items():
+            results[f"analyze_text[{size}w]"] = measure(analyze_text, chunks, args.repeat, units=lambda t: len(t.split()))
+
+    if "image_inspector" in stages:
+        paths = []
+        for i, data in enumerate(corpus.make_images(args.chunks, seed=args.seed)):
+            ext = "png" if data.startswith(b"\x89PNG") else "jpg"
+            path = f"corpus/image_{i}.{ext}"
+            with open(path, "wb") as f:
+                f.write(data)
+            paths.append(path)
+        results["image_inspector"] = measure(image_inspector, paths, args.repeat)
+
+    if "phash_lookup" in stages:
+        import random
+        from app.services.phash_service import PHASH_MAX_DISTANCE, add_image_hashes, find_near_images
+
+        # Random 64-bit hashes; each query is a stored hash with PHASH_MAX_DISTANCE bits flipped
+        rng = random.Random(args.seed)
+        stored = [rng.getrandbits(64) for _ in range(args.phash_entries)]
+        for start in range(0, len(stored), 100_000):
+            add_image_hashes({f"bench-{i}": stored[i] for i in range(start, min(len(stored), start + 100_000))})
+        queries = []
+        for image_hash in rng.sample(stored, min(len(stored), 1000)):
+            for position in rng.sample(range(64), PHASH_MAX_DISTANCE):
+                image_hash ^= 1 << position
+            queries.append(image_hash)
+        results[f"phash_lookup[{args.phash_entries}]"] = measure(find_near_images, queries, args.repeat)
+
+    if "upload_analyze" in stages:
+        from fastapi.testclient import TestClient
+        from app.main import app
+
+        client = TestClient(app)
+        counter = iter(range(1_000_000))
+
+        def upload_analyze(path):
+            # A fresh user id per call keeps file names (and cache keys) from colliding
+            user = str(next(counter))
+            with open(path, "rb") as f:
+                upload = client.post("/document/upload", params={"userId": user, "username": "bench"},
+                                     files={"file": (os.path.basename(path), f)})
+            upload.raise_for_status()
+            base = os.path.splitext(upload.json()["data"]["file_name"])[0]
+            analysis = client.get("/analyze/", params={"filename": base, "refresh": "true"})
+            analysis.raise_for_status()
+
+        results["upload_analyze[pdf]"] = measure(upload_analyze, pdfs, args.repeat, units=lambda _: args.pages)
+        results["upload_analyze[docx]"] = measure(upload_analyze, docxs, args.repeat, units=lambda _: args.pages)
+
+    return results
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)["stages"]
+
+    print(f"\n{'stage':<28}{'p50 ms':>12}{'Δ':>9}{'p95 ms':>12}{'Δ':>9}{'per s':>12}{'Δ':>9}")
+    for name, metrics in current.items():
+        old = baseline.get(name)
+        row = f"{name:<28}"
+        for key in ("p50_ms", "p95_ms", "throughput_per_s"):
+            value = metrics[key]
+            delta = ""
+            if old and old.get(key):
+                delta = f"{100 * (value - old[key]) / old[key]:+.1f}%"
+            row += f"{value:>12}{delta:>9}"
+        print(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extraction, chunking and detection.")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic document")
+    parser.add_argument("--images", type=int, default=2, help="images per page")
+    parser.add_argument("--words", type=int, default=400, help="words per page")
+    parser.add_argument("--documents", type=int, default=3, help="documents per format")
+    parser.add_argument("--chunks", type=int, default=50, help="text chunks per size, and images for image_inspector")
+    parser.add_argument("--phash-entries", type=int, default=100_000, help="hashes in the phash_lookup index")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over each input set")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--output", help="results JSON path (default benchmarks/results/bench-<time>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    parser.add_argument("--workdir", help="scratch directory (default: a temp dir, removed afterwards)")
+    args = parser.parse_args(argv)
+
+    stages = tuple(s.strip() for s in args.stages.split(",") if s.strip())
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, time.strftime("bench-%Y%m%d-%H%M%S.json")))
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    stub = start_cloud_stub()
+    os.environ["CLOUD_KEY"] = "benchmark"
+    os.environ["AI_CLOUD_URL"] = f"http://127.0.0.1:{stub.server_port}/"
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="ai-service-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    sys.path.insert(0, SERVICE_DIR)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        results = run_stages(args, stages)
+    finally:
+        os.chdir(cwd)
+        stub.shutdown()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args)
+        },
+        "stages": results
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, metrics in results.items():
+        print(f"{name:<28} p50 {metrics['p50_ms']:>9} ms  p95 {metrics['p95_ms']:>9} ms  p99 {metrics['p99_ms']:>9} ms"
+              f"  {metrics['throughput_per_s']:>10}/s  rss {metrics['peak_rss_mb']} MB")
+    print(f"\nresults: {output}")
+
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
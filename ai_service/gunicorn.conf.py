@@ -0,0 +1,46 @@
+# Production server: ./run.sh prod  (gunicorn -c gunicorn.conf.py app.main:app)
+#
+# The app is imported once in the master (preload_app) and the heavy libraries
+# are loaded there too, so every worker forks with them already in memory;
+# each worker then warms up before taking requests.
+#
+# Workers share state through files: upload jobs and the caches and indexes
+# are SQLite databases under cache/, and every worker writes its metrics to
+# METRICS_DIR, which /metrics adds up. The upload queue limits
+# (UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE) and the text worker processes are per
+# worker.
+import os
+import glob
+import time
+import multiprocessing
+
+_config_loaded = time.perf_counter()
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+os.environ.setdefault("APP_WARM_UP", "1")
+os.environ.setdefault("METRICS_DIR", os.path.join("cache", "metrics"))
+
+
+def on_starting(server):
+    # Totals of a previous server run would otherwise be added to this one's
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported, before any worker is forked
+    from app import startup
+
+    times = startup.preload()
+    server.log.info("App and libraries loaded in %.0f ms (%s)",
+                    1000 * (time.perf_counter() - _config_loaded), startup.format_import_times(times))
@@ -1,4 +1,10 @@
 #!/bin/bash
 # Script to run FastAPI app with Uvicorn
+#   ./run.sh        development server with auto-reload
+#   ./run.sh prod   multi-worker production server (settings in gunicorn.conf.py)
+
+if [ "$1" = "prod" ]; then
+    exec gunicorn -c gunicorn.conf.py app.main:app
+fi
 
 uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
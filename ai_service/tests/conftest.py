@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the service as `app`, the way the server does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory: outputs, caches and indexes are relative paths."""
+    from app.utils import output_index
+
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(output_index.OUTPUT_DIR)
+    monkeypatch.setattr(output_index, "_conn", None)
+    return tmp_path
@@ -0,0 +1,159 @@
+"""Sentence-aware chunking (chunk_service.iter_chunks) and its cache versioning."""
+import random
+import re
+
+import pytest
+
+from app.services.chunk_service import CHUNKER_VERSION, iter_chunks
+from app.utils.json_utils import save_pack
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def _document(seed: int, pages: int = 6) -> list[dict]:
+    """Pages of sentences of 1-40 words, with the odd run-on sentence and page cut mid-sentence."""
+    rng = random.Random(seed)
+    records = []
+    for page in range(1, pages + 1):
+        sentences = []
+        for _ in range(rng.randint(0, 12)):
+            length = rng.choice([rng.randint(1, 40), rng.randint(1, 40), rng.randint(60, 150)])
+            words = [f"p{page}w{rng.randint(0, 999)}" for _ in range(length)]
+            sentences.append(" ".join(words) + rng.choice(".!?"))
+        text = " ".join(sentences)
+        if sentences and rng.random() < 0.5:
+            text = text[:-1]  # the last sentence continues on the next page
+        records.append({"page": page, "text": f"  {text}\n" if rng.random() < 0.3 else text,
+                        "images": [{"id": f"img_{page}"}] if page % 2 else []})
+    return records
+
+
+def _word_spans(text: str) -> list[tuple[int, int]]:
+    return [m.span() for m in _WORD_RE.finditer(text)]
+
+
+CASES = [(seed, max_words, overlap, span_pages)
+         for seed in range(8)
+         for max_words, overlap in ((450, 0), (50, 0), (50, 20), (7, 3), (1, 0))
+         for span_pages in (False, True)]
+
+
+@pytest.mark.parametrize("seed, max_words, overlap, span_pages", CASES)
+def test_word_budget(seed, max_words, overlap, span_pages):
+    for chunk in iter_chunks(_document(seed), max_words, overlap, span_pages):
+        assert 1 <= len(chunk["chunk"].split()) <= max_words
+
+
+@pytest.mark.parametrize("seed, max_words, overlap, span_pages", CASES)
+def test_offsets_match_the_page_text(seed, max_words, overlap, span_pages):
+    pages = {page["page"]: page["text"] for page in _document(seed)}
+    for chunk in iter_chunks(_document(seed), max_words, overlap, span_pages):
+        first, last = pages[chunk["page"]], pages[chunk["end_page"]]
+        if chunk["page"] == chunk["end_page"]:
+            assert chunk["chunk"] == first[chunk["start"]:chunk["end"]]
+        else:
+            assert span_pages and chunk["end_page"] > chunk["page"]
+            assert chunk["chunk"].startswith(first[chunk["start"]:].rstrip())
+            assert chunk["chunk"].endswith(last[:chunk["end"]].lstrip())
+        # Offsets never cut a word
+        assert chunk["start"] == 0 or first[chunk["start"] - 1].isspace()
+        assert chunk["end"] == len(last) or last[chunk["end"]].isspace()
+
+
+@pytest.mark.parametrize("seed, max_words, overlap, span_pages", CASES)
+def test_every_word_is_covered_in_order(seed, max_words, overlap, span_pages):
+    document = _document(seed)
+    chunks = list(iter_chunks(document, max_words, overlap, span_pages))
+
+    covered = {page["page"]: [] for page in document}
+    for chunk in chunks:
+        for page in range(chunk["page"], chunk["end_page"] + 1):
+            start = chunk["start"] if page == chunk["page"] else 0
+            end = chunk["end"] if page == chunk["end_page"] else len(document[page - 1]["text"])
+            covered[page].append((start, end))
+
+    for page in document:
+        spans = covered[page["page"]]
+        # Chunks advance through the document; only an overlap steps back
+        assert spans == sorted(spans, key=lambda span: span[1])
+        for word_start, word_end in _word_spans(page["text"]):
+            assert any(start <= word_start and word_end <= end for start, end in spans)
+
+
+@pytest.mark.parametrize("seed, max_words, span_pages", [(seed, 50, span) for seed in range(8) for span in (False, True)])
+def test_no_overlap_splits_words_exactly_once(seed, max_words, span_pages):
+    document = _document(seed)
+    words = [word for page in document for word in page["text"].split()]
+    chunked = [word for chunk in iter_chunks(document, max_words, 0, span_pages) for word in chunk["chunk"].split()]
+    assert chunked == words
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_overlap_repeats_at_most_overlap_words(seed):
+    chunks = list(iter_chunks(_document(seed), 50, 20))
+    pages = {page["page"]: page["text"] for page in _document(seed)}
+    for previous, chunk in zip(chunks, chunks[1:]):
+        if chunk["page"] == previous["page"]:
+            # Never the whole previous chunk, and only its trailing sentences
+            assert chunk["start"] > previous["start"]
+            repeated = pages[chunk["page"]][chunk["start"]:previous["end"]]
+            assert len(repeated.split()) <= 20
+            assert previous["chunk"].endswith(repeated)
+
+
+def test_span_pages_keeps_a_sentence_cut_by_a_page_break_together():
+    pages = [{"page": 1, "text": "First sentence here. The second one runs"},
+             {"page": 2, "text": "onto the next page. Then a third."}]
+
+    apart = [chunk["chunk"] for chunk in iter_chunks(pages, 10)]
+    together = [chunk["chunk"] for chunk in iter_chunks(pages, 10, span_pages=True)]
+
+    assert apart == ["First sentence here. The second one runs", "onto the next page. Then a third."]
+    assert together == ["First sentence here.", "The second one runs\nonto the next page.", "Then a third."]
+
+
+def test_chunks_refer_to_their_pages_images_by_id():
+    pages = [{"page": 1, "text": "One. Two.", "images": [{"id": "a"}, {"id": "a"}]},
+             {"page": 2, "text": "Three.", "images": ["b.png"]}]
+    assert [chunk["images"] for chunk in iter_chunks(pages, 10)] == [["a"], ["b.png"]]
+
+
+@pytest.mark.parametrize("max_words, overlap", [(0, 0), (10, 10), (10, -1)])
+def test_invalid_budgets_are_rejected(max_words, overlap):
+    with pytest.raises(ValueError):
+        list(iter_chunks([{"page": 1, "text": "Text."}], max_words, overlap))
+
+
+def test_chunk_boundaries_are_pinned_to_the_chunker_version():
+    # Cached analyses are keyed on CHUNKER_VERSION: if this fails because the
+    # boundaries changed on purpose, bump CHUNKER_VERSION and update both here.
+    pages = [{"page": 1, "text": "One two. Three four. Five six seven. Eight nine ten eleven twelve thirteen. Fourteen"},
+             {"page": 2, "text": "fifteen. Sixteen!"}]
+    chunks = [(chunk["id"], chunk["page"], chunk["start"], chunk["end_page"], chunk["end"], chunk["chunk"])
+              for chunk in iter_chunks(pages, 5, 2, span_pages=True)]
+    assert (CHUNKER_VERSION, chunks) == ("2", [
+        ("1_1", 1, 0, 1, 20, "One two. Three four."),
+        ("1_2", 1, 9, 1, 36, "Three four. Five six seven."),
+        ("1_3", 1, 37, 1, 65, "Eight nine ten eleven twelve"),
+        ("1_4", 1, 66, 2, 17, "thirteen. Fourteen\nfifteen. Sixteen!"),
+    ])
+
+
+def test_document_cache_key_follows_chunking(workdir, monkeypatch):
+    from app.routes import analyze_routes
+    from app.services import cache_service
+
+    monkeypatch.setattr(cache_service, "_conn", None)
+    save_pack(_document(0), "doc.pack")
+
+    def key(max_words, overlap, span_pages):
+        return analyze_routes._open_document("doc", False, 1, max_words, overlap, span_pages)[3]
+
+    assert f".c{CHUNKER_VERSION}." in key(450, 0, False)
+    assert key(450, 0, False) == key(450, 0, False)
+    assert len({key(450, 0, False), key(100, 0, False), key(450, 10, False), key(450, 0, True)}) == 4
+
+    monkeypatch.setattr(analyze_routes, "DOCUMENT_VERSION", analyze_routes.DOCUMENT_VERSION.replace(
+        f".c{CHUNKER_VERSION}", f".c{CHUNKER_VERSION}-next"))
+    assert f".c{CHUNKER_VERSION}-next." in key(450, 0, False)
+
@@ -0,0 +1,145 @@
+"""
+Retry and circuit-breaker behaviour of CloudDetectorClient against a local
+stub of the cloud detector:
+
+    cd ai_service && python -m pytest tests
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.helpers.cloud_helper import (CLOUD_ERROR_VERDICT, CircuitBreaker, CloudDetectorClient, combine_verdicts,
+                                     error_verdict, make_verdict)
+
+
+class _CloudStub(BaseHTTPRequestHandler):
+    # Per-server script: statuses to answer with, in order (the last one repeats)
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            status = server.statuses[min(server.requests, len(server.statuses)) - 1]
+        server.release.wait(5)
+
+        body = b'{"score": 0.42}' if status == 200 else b'{}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CloudStub)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.statuses = [200]
+    server.release = threading.Event()
+    server.release.set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, threshold=2, cooldown=60.0, max_retries=2) -> CloudDetectorClient:
+    return CloudDetectorClient(f"http://127.0.0.1:{server.server_port}/", "key", max_retries=max_retries,
+                               backoff_base=0, backoff_max=0, breaker=CircuitBreaker(threshold, cooldown))
+
+
+def _expire_cooldown(breaker: CircuitBreaker) -> None:
+    breaker._opened_at -= breaker.cooldown
+
+
+def test_retries_transient_errors(stub):
+    stub.statuses = [503, 502, 200]
+    client = _client(stub)
+
+    assert client.detect("text")["ai_confidence"] == 42.0
+    assert stub.requests == 3
+    assert not client.breaker.is_open
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.statuses = [400]
+    client = _client(stub)
+
+    assert client.detect("text")["verdict"] == CLOUD_ERROR_VERDICT
+    assert stub.requests == 1
+    assert not client.breaker.is_open
+
+
+def test_breaker_opens_and_rejects_without_calling_upstream(stub):
+    stub.statuses = [503]
+    client = _client(stub, threshold=2, max_retries=1)
+
+    client.detect("one")
+    assert not client.breaker.is_open
+    client.detect("two")
+    assert client.breaker.is_open
+    assert stub.requests == 4
+
+    assert client.detect("three")["verdict"] == CLOUD_ERROR_VERDICT
+    assert stub.requests == 4
+
+
+def test_half_open_admits_a_single_trial(stub):
+    stub.statuses = [503, 200]
+    client = _client(stub, threshold=1, max_retries=0)
+    client.detect("opens")
+    assert client.breaker.is_open
+    _expire_cooldown(client.breaker)
+
+    # Hold the trial inside the stub while the other callers arrive
+    stub.release.clear()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(client.detect, f"text {i}") for i in range(8)]
+        # Rejections return at once; give up after a few seconds if they don't
+        deadline = time.monotonic() + 5
+        done = set()
+        while len(done) < 7 and time.monotonic() < deadline:
+            done, _ = wait(futures, timeout=0.05)
+        rejected = len(done)
+        stub.release.set()
+        verdicts = [f.result() for f in futures]
+
+    assert stub.requests == 2
+    assert rejected == 7
+    assert sum(1 for v in verdicts if v["verdict"] != CLOUD_ERROR_VERDICT) == 1
+    assert not client.breaker.is_open
+
+
+def test_failed_trial_reopens(stub):
+    stub.statuses = [503]
+    client = _client(stub, threshold=3, max_retries=0)
+    for _ in range(3):
+        client.detect("text")
+    _expire_cooldown(client.breaker)
+
+    client.detect("trial")
+    assert client.breaker.is_open
+    assert stub.requests == 4
+    client.detect("rejected")
+    assert stub.requests == 4
+
+
+def test_combine_verdicts_weights_segments_by_size():
+    assert combine_verdicts([make_verdict(1.0), make_verdict(0.0)], [3, 1])["ai_confidence"] == 75.0
+    # Failed segments are left out; all of them failing gives the error verdict
+    assert combine_verdicts([make_verdict(0.5), error_verdict()], [1, 9])["ai_confidence"] == 50.0
+    assert combine_verdicts([error_verdict()], [1])["verdict"] == CLOUD_ERROR_VERDICT
+
+
+def test_combine_verdicts_counts_zero_weights_once():
+    # A segment of weight 0 counts as 1, in the score and in the total alike
+    assert combine_verdicts([make_verdict(1.0)] * 2, [0, 1])["ai_confidence"] == 100.0
+    assert combine_verdicts([make_verdict(1.0), make_verdict(0.0)], [0, 0])["ai_confidence"] == 50.0
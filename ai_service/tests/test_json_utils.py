@@ -0,0 +1,66 @@
+"""Page packs (json_utils.save_pack / PageReader): the on-disk format."""
+import os
+
+import pytest
+
+from app.utils.json_utils import PACK_MAGIC, PageReader, iter_pack, load_json, save_pack
+
+PAGES = [{"page": i + 1, "text": f"Page {i + 1} " + "word " * i, "images": [{"id": f"doc_image_{i}"}] * (i % 3)}
+         for i in range(50)]
+
+
+@pytest.fixture
+def pack(workdir):
+    return save_pack(iter(PAGES), "doc.pack")
+
+
+def test_round_trip(pack):
+    assert list(iter_pack(pack)) == PAGES
+    assert load_json(pack) == PAGES
+    # Names inside the output directory resolve too
+    assert list(iter_pack(os.path.basename(pack))) == PAGES
+
+
+def test_random_access(pack):
+    with PageReader(pack) as reader:
+        assert len(reader) == len(PAGES)
+        for index in (37, 0, 49, 12, -1, -50):
+            assert reader[index] == PAGES[index]
+        with pytest.raises(IndexError):
+            reader[50]
+        with pytest.raises(IndexError):
+            reader[-51]
+
+
+def test_empty_pack(workdir):
+    with PageReader(save_pack([], "empty.pack")) as reader:
+        assert len(reader) == 0
+        assert list(reader) == []
+
+
+def test_names_do_not_overwrite(pack):
+    again = save_pack(iter(PAGES[:1]), "doc.pack")
+    assert os.path.basename(again) == "doc_duplicate_1.pack"
+    assert list(iter_pack(pack)) == PAGES
+
+
+@pytest.mark.parametrize("keep", [0, 3, len(PACK_MAGIC) + 100, -1, -8, -30])
+def test_truncated_pack_is_rejected(pack, keep):
+    with open(pack, "rb") as f:
+        data = f.read()
+    with open(pack, "wb") as f:
+        f.write(data[:keep])
+    with pytest.raises(ValueError):
+        PageReader(pack)
+
+
+def test_bad_magic_is_rejected(pack):
+    with open(pack, "r+b") as f:
+        f.write(b"NOTAPACK")
+    with pytest.raises(ValueError):
+        PageReader(pack)
+
+    with open(os.path.join("output", "doc.json"), "wb") as f:
+        f.write(b'{"page": 1, "text": "not a pack at all, but long enough to hold a trailer"}')
+    with pytest.raises(ValueError):
+        PageReader("doc.json")